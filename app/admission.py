@@ -0,0 +1,264 @@
+"""التحكم في القبول — حدود لكل مستخدم (طلبات + رموز LLM) وحساب الاستهلاك اليومي"""
+
+import json
+import time
+import asyncio
+import logging
+from array import array
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# تقدير تقريبي لعدد الرموز في النص العربي
+_CHARS_PER_TOKEN = 3
+# رموز ثابتة تقريبية: موجّه النظام + تنسيق السياق
+_PROMPT_OVERHEAD_TOKENS = 400
+# تقدير طول الإجابة قبل معرفة الاستهلاك الفعلي (يُسوّى بعد الرد)
+_EST_COMPLETION_TOKENS = 500
+
+# أعمدة عدّاد الاستهلاك
+_REQUESTS, _PROMPT, _COMPLETION = 0, 1, 2
+
+
+def estimate_tokens(question: str) -> int:
+    """تقدير رموز السؤال قبل تنفيذه: السؤال + السياق المسترجع + الإجابة"""
+    context_chars = settings.top_k_results * settings.chunk_size
+    return (
+        (len(question) + context_chars) // _CHARS_PER_TOKEN
+        + _PROMPT_OVERHEAD_TOKENS
+        + _EST_COMPLETION_TOKENS
+    )
+
+
+@dataclass
+class TokenBucket:
+    """دلو رموز: سعة قصوى تمتلئ بمعدل ثابت"""
+    capacity: float
+    refill_per_second: float
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def try_consume(self, amount: float, now: float | None = None) -> bool:
+        self._refill(now if now is not None else time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def adjust(self, amount: float):
+        """تسوية بعد معرفة الاستهلاك الفعلي (موجب = استرداد، سالب = خصم إضافي)"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def retry_after(self, amount: float) -> float:
+        """الثواني اللازمة حتى يتوفر المقدار المطلوب"""
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.refill_per_second) if self.refill_per_second else float("inf")
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class Admission:
+    """قرار القبول"""
+    allowed: bool
+    estimated_tokens: int = 0
+    retry_after: float = 0.0
+    reason: str = ""
+
+
+class AdmissionController:
+    """دلوان لكل مستخدم تيليغرام: عدد الطلبات، ورموز LLM المقدّرة"""
+
+    def __init__(self):
+        self._requests: dict[int, TokenBucket] = {}
+        self._tokens: dict[int, TokenBucket] = {}
+        self.rejected = 0
+
+    @staticmethod
+    def is_exempt(user_id: int) -> bool:
+        return user_id == settings.admin_chat_id or user_id in settings.admission_exempt_ids
+
+    def _bucket(self, pool: dict[int, TokenBucket], user_id: int, capacity: int, window: int) -> TokenBucket:
+        bucket = pool.get(user_id)
+        if bucket is None:
+            bucket = pool[user_id] = TokenBucket(capacity, capacity / window)
+        return bucket
+
+    def admit(self, user_id: int, question: str) -> Admission:
+        """فحص السؤال قبل تشغيل RAG وخصم التقدير من الدلوين"""
+        estimate = estimate_tokens(question)
+        if self.is_exempt(user_id):
+            return Admission(allowed=True, estimated_tokens=estimate)
+
+        now = time.monotonic()
+        requests = self._bucket(
+            self._requests, user_id,
+            settings.rate_limit_requests, settings.rate_limit_window_seconds,
+        )
+        tokens = self._bucket(
+            self._tokens, user_id,
+            settings.token_budget, settings.token_budget_window_seconds,
+        )
+
+        if not requests.try_consume(1, now):
+            self.rejected += 1
+            return Admission(False, estimate, requests.retry_after(1), "requests")
+        if not tokens.try_consume(estimate, now):
+            requests.adjust(1)
+            self.rejected += 1
+            return Admission(False, estimate, tokens.retry_after(estimate), "tokens")
+        return Admission(allowed=True, estimated_tokens=estimate)
+
+    def settle(self, user_id: int, admission: Admission, usage: dict[str, int]):
+        """تسوية دلو الرموز بالاستهلاك الفعلي الذي أعاده OpenRouter"""
+        bucket = self._tokens.get(user_id)
+        if bucket is None:
+            return
+        actual = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        bucket.adjust(admission.estimated_tokens - actual)
+
+    def prune(self):
+        """حذف دلاء المستخدمين الخاملين (الممتلئة) لتوفير الذاكرة"""
+        now = time.monotonic()
+        for pool in (self._requests, self._tokens):
+            for user_id in [uid for uid, b in pool.items() if b.is_full(now)]:
+                del pool[user_id]
+
+
+class UsageLedger:
+    """استهلاك رموز LLM لكل مستخدم ولكل يوم
+
+    في الذاكرة: {(اليوم، المستخدم): array[طلبات، رموز الموجّه، رموز الإجابة]}
+    للزيادات منذ آخر حفظ فقط، وتُضاف دورياً إلى ملف JSON لكل يوم.
+    """
+
+    def __init__(self, directory: str | None = None):
+        self._dir = Path(directory or settings.usage_dir)
+        self._pending: dict[tuple[int, int], array] = {}
+
+    def record(self, user_id: int, usage: dict[str, int]):
+        key = (date.today().toordinal(), user_id)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = array("Q", (0, 0, 0))
+        counters[_REQUESTS] += 1
+        counters[_PROMPT] += usage.get("prompt_tokens", 0)
+        counters[_COMPLETION] += usage.get("completion_tokens", 0)
+
+    def _path(self, day: int) -> Path:
+        return self._dir / f"usage-{date.fromordinal(day).isoformat()}.json"
+
+    def _read_day(self, day: int) -> dict[int, list[int]]:
+        path = self._path(day)
+        if not path.exists():
+            return {}
+        try:
+            return {int(uid): row for uid, row in json.loads(path.read_text(encoding="utf-8")).items()}
+        except Exception as e:
+            logger.error(f"خطأ في قراءة {path.name}: {e}")
+            return {}
+
+    def flush(self):
+        """إضافة الزيادات المعلّقة إلى ملفات الأيام ثم تفريغها
+
+        إن فشلت الكتابة تُعاد زيادات الأيام التي لم تُحفظ إلى المعلّقة لتُحاوَل لاحقاً.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        by_day: dict[int, dict[int, array]] = {}
+        for (day, user_id), counters in pending.items():
+            by_day.setdefault(day, {})[user_id] = counters
+
+        written: set[int] = set()
+        try:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            for day, users in by_day.items():
+                totals = self._read_day(day)
+                for user_id, counters in users.items():
+                    row = totals.setdefault(user_id, [0, 0, 0])
+                    for i, value in enumerate(counters):
+                        row[i] += value
+                path = self._path(day)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text(json.dumps({str(uid): row for uid, row in totals.items()}), encoding="utf-8")
+                tmp.replace(path)
+                written.add(day)
+        except Exception:
+            self._restore(
+                {key: counters for key, counters in pending.items() if key[0] not in written}
+            )
+            raise
+        logger.info(f"💾 حفظ استهلاك {len(pending)} مستخدم/يوم")
+
+    def _restore(self, pending: dict[tuple[int, int], array]):
+        """دمج زيادات لم تُحفظ مع ما سُجّل منذ بدء الحفظ"""
+        for key, counters in pending.items():
+            current = self._pending.get(key)
+            if current is None:
+                self._pending[key] = counters
+            else:
+                for i, value in enumerate(counters):
+                    current[i] += value
+
+    def top(self, days: int = 1, limit: int = 10) -> list[tuple[int, list[int]]]:
+        """أعلى المستهلكين (بمجموع الرموز) خلال آخر عدد من الأيام"""
+        today = date.today().toordinal()
+        totals: dict[int, list[int]] = {}
+        for day in range(today - days + 1, today + 1):
+            for user_id, row in self._read_day(day).items():
+                acc = totals.setdefault(user_id, [0, 0, 0])
+                for i, value in enumerate(row):
+                    acc[i] += value
+        for (day, user_id), counters in self._pending.items():
+            if day > today - days:
+                acc = totals.setdefault(user_id, [0, 0, 0])
+                for i, value in enumerate(counters):
+                    acc[i] += value
+
+        ranked = sorted(totals.items(), key=lambda kv: kv[1][_PROMPT] + kv[1][_COMPLETION], reverse=True)
+        return ranked[:limit]
+
+    async def run_flush_loop(self, admission: "AdmissionController | None" = None):
+        """حفظ دوري في الخلفية (ويُنظّف دلاء الخاملين في الوقت نفسه)"""
+        while True:
+            await asyncio.sleep(settings.usage_flush_seconds)
+            try:
+                self.flush()
+                if admission is not None:
+                    admission.prune()
+            except Exception as e:
+                logger.error(f"❌ فشل حفظ الاستهلاك: {e}")
+
+
+# Singletons
+_admission: AdmissionController | None = None
+_ledger: UsageLedger | None = None
+
+
+def get_admission() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+
+def get_usage_ledger() -> UsageLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = UsageLedger()
+    return _ledger
@@ -1,5 +1,6 @@
 """معالجات بوت تيليغرام"""
 
+import html
 import logging
 from telegram import Update, BotCommand
 from telegram.ext import (
@@ -12,6 +13,7 @@ from telegram.ext import (
 )
 from app.config import get_settings
 from app.rag.engine import get_engine
+from app.admission import get_admission, get_usage_ledger
 from app.escalation import (
     should_escalate_by_keywords,
     escalate_to_admin,
@@ -50,6 +52,7 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/start — بدء المحادثة\n"
         "/help — عرض المساعدة\n"
         "/human — طلب التحدث مع المختص\n"
+        "/kb — عرض أو اختيار قاعدة المعرفة\n"
         "/status — حالة البوت\n\n"
         "💡 أو اكتب سؤالك مباشرة!",
         parse_mode="HTML",
@@ -70,22 +73,60 @@ async def cmd_human(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await notify_user_escalated(context.bot, update.effective_chat.id)
 
 
+def _resolve_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """قاعدة المعرفة لهذه المحادثة (اختيار /kb ← ربط المحادثة ← الافتراضية)"""
+    return get_engine().registry.resolve(
+        chat_id=update.effective_chat.id,
+        selected=context.chat_data.get("tenant"),
+    )
+
+
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر /status — حالة البوت"""
     engine = get_engine()
-    count = engine.get_collection_count()
+    tenant = _resolve_tenant(update, context)
+    count = engine.get_collection_count(tenant)
     await update.message.reply_text(
         "🤖 <b>حالة البوت:</b>\n\n"
+        f"🗂 قاعدة المعرفة: <b>{tenant}</b>\n"
         f"📚 المقاطع في قاعدة المعرفة: <b>{count}</b>\n"
         f"🧠 نموذج التوليد: <b>Kimi 2.5</b>\n"
         f"📐 نموذج الـ Embedding: <b>{settings.embedding_model}</b>\n"
-        f"✅ البوت يعمل بشكل طبيعي",
+        + (
+            "⚡ البوت تحت ضغط — الإجابات مقتطفة من المستندات مباشرة"
+            if engine.load_metrics()["degraded"]
+            else "✅ البوت يعمل بشكل طبيعي"
+        ),
+        parse_mode="HTML",
+    )
+
+
+async def cmd_kb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /kb — عرض قواعد المعرفة المتاحة أو اختيار إحداها لهذه المحادثة"""
+    registry = get_engine().registry
+    tenants = registry.list_tenants()
+
+    if context.args:
+        tenant = context.args[0]
+        if tenant not in tenants:
+            await update.message.reply_text(f"❌ قاعدة المعرفة غير موجودة: {tenant}")
+            return
+        context.chat_data["tenant"] = tenant
+        await update.message.reply_text(f"✅ تم اختيار قاعدة المعرفة: {tenant}")
+        return
+
+    current = _resolve_tenant(update, context)
+    lines = [f"{'👉' if t == current else '•'} <code>{t}</code>" for t in tenants]
+    await update.message.reply_text(
+        "🗂 <b>قواعد المعرفة المتاحة:</b>\n\n"
+        + "\n".join(lines)
+        + "\n\n💡 للاختيار: <code>/kb الاسم</code>",
         parse_mode="HTML",
     )
 
 
 # ══════════════════════════════════════
-#  أمر الرد من المشرف
+#  أوامر المشرف
 # ══════════════════════════════════════
 
 async def cmd_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -118,6 +159,64 @@ async def cmd_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ فشل الإرسال: {e}")
 
 
+async def cmd_tenants(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /tenants — مقاييس قواعد المعرفة (للمشرف)"""
+    if update.effective_user.id != settings.admin_chat_id:
+        return
+
+    registry = get_engine().registry
+    metrics = registry.snapshot()
+    if not metrics:
+        await update.message.reply_text("لا توجد قواعد معرفة مُستخدمة بعد.")
+        return
+
+    lines = []
+    for tenant, m in metrics.items():
+        state = "🟢" if m["loaded"] else "⚪"
+        lines.append(
+            f"{state} <b>{tenant}</b>\n"
+            f"   أسئلة: {m['queries']} | تصعيد: {m['escalations']} | "
+            f"متوسط الزمن: {m['avg_latency']:.2f} ث\n"
+            f"   ذاكرة (تقدير): ~{m['memory_mb']} MB | تحميل: {m['loads']} | إخلاء: {m['evictions']}"
+        )
+    used_mb = registry.memory_used() / 1024 / 1024
+    await update.message.reply_text(
+        "🗂 <b>قواعد المعرفة:</b>\n\n"
+        + "\n\n".join(lines)
+        + f"\n\n💾 الذاكرة المستخدمة: ~{used_mb:.1f} / {settings.tenant_memory_budget_mb} MB",
+        parse_mode="HTML",
+    )
+
+
+async def cmd_usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /usage [أيام] — أعلى المستهلكين لرموز LLM (للمشرف)"""
+    if update.effective_user.id != settings.admin_chat_id:
+        return
+
+    try:
+        days = max(1, int(context.args[0])) if context.args else 1
+    except ValueError:
+        await update.message.reply_text("⚠️ الاستخدام:\n<code>/usage [عدد الأيام]</code>", parse_mode="HTML")
+        return
+
+    top = get_usage_ledger().top(days=days)
+    if not top:
+        await update.message.reply_text("لا يوجد استهلاك مسجّل في هذه الفترة.")
+        return
+
+    lines = [
+        f"{i}. <code>{user_id}</code> — {requests} سؤال | "
+        f"موجّه: {prompt:,} | إجابة: {completion:,} | المجموع: <b>{prompt + completion:,}</b>"
+        for i, (user_id, (requests, prompt, completion)) in enumerate(top, start=1)
+    ]
+    await update.message.reply_text(
+        f"📊 <b>أعلى المستهلكين (آخر {days} يوم):</b>\n\n"
+        + "\n".join(lines)
+        + f"\n\n⛔ أسئلة مرفوضة منذ التشغيل: {get_admission().rejected}",
+        parse_mode="HTML",
+    )
+
+
 # ══════════════════════════════════════
 #  معالجة الرسائل النصية (السؤال الرئيسي)
 # ══════════════════════════════════════
@@ -132,35 +231,61 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     logger.info(f"📩 سؤال من {user.full_name} ({user.id}): {message_text[:80]}")
 
-    # --- 1. فحص التصعيد بالكلمات المفتاحية ---
-    if should_escalate_by_keywords(message_text):
-        await escalate_to_admin(
-            bot=context.bot,
-            user_id=user.id,
-            user_name=user.username,
-            user_full_name=user.full_name,
-            question=message_text,
-            reason="كلمة مفتاحية للتصعيد",
+    # --- 0. حدود الاستخدام ---
+    admission = get_admission().admit(user.id, message_text)
+    if not admission.allowed:
+        logger.info(f"⛔ رفض سؤال من {user.id} ({admission.reason}) — إعادة بعد {admission.retry_after:.0f} ث")
+        await update.message.reply_text(
+            "⏳ لقد تجاوزت الحد المسموح من الأسئلة مؤقتاً.\n"
+            f"يرجى المحاولة بعد {max(1, round(admission.retry_after / 60))} دقيقة تقريباً."
         )
-        await notify_user_escalated(context.bot, update.effective_chat.id)
         return
 
-    # --- 2. عرض مؤشر الكتابة ---
-    await context.bot.send_chat_action(
-        chat_id=update.effective_chat.id,
-        action="typing",
-    )
+    # تسوية دلو الرموز مرة واحدة مهما كان المخرج ({} = لم يُستدعَ LLM فيُسترد التقدير كاملاً)
+    usage: dict[str, int] = {}
+    try:
+        # --- 1. فحص التصعيد بالكلمات المفتاحية ---
+        if should_escalate_by_keywords(message_text):
+            await escalate_to_admin(
+                bot=context.bot,
+                user_id=user.id,
+                user_name=user.username,
+                user_full_name=user.full_name,
+                question=message_text,
+                reason="كلمة مفتاحية للتصعيد",
+            )
+            await notify_user_escalated(context.bot, update.effective_chat.id)
+            return
 
-    # --- 3. تشغيل RAG ---
-    engine = get_engine()
-    result = await engine.query(message_text)
+        # --- 2. عرض مؤشر الكتابة ---
+        await context.bot.send_chat_action(
+            chat_id=update.effective_chat.id,
+            action="typing",
+        )
+
+        # --- 3. تشغيل RAG ---
+        engine = get_engine()
+        tenant = _resolve_tenant(update, context)
+        result = await engine.query(message_text, tenant=tenant)
+        usage = result.usage
+    finally:
+        get_admission().settle(user.id, admission, usage)
+    get_usage_ledger().record(user.id, usage)
 
     # --- 4. تقييم النتيجة ---
+    answer = result.answer
+    if result.extractive:
+        # وضع تخفيف الحمل: مقتطفات من المستندات بدون LLM
+        answer = (
+            "⚡ <i>الخدمة تحت ضغط حالياً — إليك مقتطفات مباشرة من المستندات:</i>\n\n"
+            f"{html.escape(result.answer)}"
+        )
+
     if result.needs_escalation:
         # إرسال ما وُجد (إن وُجد) ثم تصعيد
         if result.answer and result.confidence == "medium":
             await update.message.reply_text(
-                f"{result.answer}\n\n"
+                f"{answer}\n\n"
                 "⚠️ <i>هذه الإجابة قد تكون غير مكتملة. "
                 "سأحوّل سؤالك للمختص للتأكد.</i>",
                 parse_mode="HTML",
@@ -173,16 +298,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_full_name=user.full_name,
             question=message_text,
             context=result.answer if result.answer else "",
-            reason=f"ثقة: {result.confidence} | أعلى تشابه: {max(result.similarity_scores) if result.similarity_scores else 0:.2f}",
+            reason=(
+                f"ثقة: {result.confidence} | أعلى تشابه: "
+                f"{max(result.similarity_scores) if result.similarity_scores else 0:.2f} | "
+                f"قاعدة المعرفة: {result.tenant}"
+                + (" | إجابة مقتطفة (تخفيف الحمل)" if result.extractive else "")
+            ),
         )
         await notify_user_escalated(context.bot, update.effective_chat.id)
     else:
         # إجابة واثقة — إرسال مباشر
-        await update.message.reply_text(result.answer)
+        if result.extractive:
+            await update.message.reply_text(answer, parse_mode="HTML")
+        else:
+            await update.message.reply_text(result.answer)
 
     logger.info(
-        f"✅ رد على {user.full_name} | ثقة: {result.confidence} | "
-        f"تصعيد: {result.needs_escalation}"
+        f"✅ رد على {user.full_name} | {result.tenant} | ثقة: {result.confidence} | "
+        f"تصعيد: {result.needs_escalation} | مقتطف: {result.extractive}"
     )
 
 
@@ -227,7 +360,10 @@ def create_bot_app() -> Application:
     app.add_handler(CommandHandler("help", cmd_help))
     app.add_handler(CommandHandler("human", cmd_human))
     app.add_handler(CommandHandler("status", cmd_status))
+    app.add_handler(CommandHandler("kb", cmd_kb))
     app.add_handler(CommandHandler("reply", cmd_reply))
+    app.add_handler(CommandHandler("tenants", cmd_tenants))
+    app.add_handler(CommandHandler("usage", cmd_usage))
 
     # أزرار
     app.add_handler(CallbackQueryHandler(handle_callback))
@@ -244,6 +380,7 @@ async def set_bot_commands(app: Application):
         BotCommand("start", "بدء المحادثة"),
         BotCommand("help", "عرض المساعدة"),
         BotCommand("human", "التحدث مع المختص"),
+        BotCommand("kb", "قاعدة المعرفة"),
         BotCommand("status", "حالة البوت"),
     ]
     await app.bot.set_my_commands(commands)
@@ -23,6 +23,30 @@ class Settings(BaseSettings):
     top_k_results: int = 5
     chunk_size: int = 800
     chunk_overlap: int = 150
+    embedding_quantization: str = "none"     # none / int8 / binary
+    rescore_multiplier: int = 4              # حجم القائمة القصيرة = top_k × المعامل
+    route_top_documents: int = 2             # التوجيه: أفضل المستندات
+    route_top_sections: int = 4              # التوجيه: أفضل الأقسام داخلها (0 = تعطيل)
+    ingest_workers: int = 0          # 0 = عدد أنوية المعالج
+
+    # التخزين المؤقت للموجّه لدى المزوّد
+    prompt_cache_control: str = "auto"       # auto / on / off — علامات cache_control
+
+    # تخفيف الحمل — إجابة مقتطفة بدون LLM عند الضغط
+    shed_max_inflight: int = 8               # طلبات LLM متزامنة
+    shed_latency_seconds: float = 20.0       # متوسط زمن LLM الحديث
+    shed_latency_window_seconds: int = 120   # نافذة قياس الزمن الحديث
+    shed_confident_margin: float = 0.15      # هامش فوق العتبة لعدم التصعيد
+    extractive_sentences: int = 3
+
+    # حدود الاستخدام لكل مستخدم
+    rate_limit_requests: int = 10            # أسئلة لكل نافذة
+    rate_limit_window_seconds: int = 60
+    token_budget: int = 60000                # رموز LLM مقدّرة لكل نافذة
+    token_budget_window_seconds: int = 3600
+    admission_exempt_ids: list[int] = []     # مستثنون (إضافة للمشرف)
+    usage_dir: str = "./data/usage"
+    usage_flush_seconds: int = 60
 
     # Server
     webhook_url: str = ""
@@ -31,7 +55,11 @@ class Settings(BaseSettings):
 
     # ChromaDB
     chroma_persist_dir: str = "./data/chromadb"
-    chroma_collection: str = "grad_studies"
+    chroma_collection: str = "grad_studies"   # قاعدة المعرفة الافتراضية
+
+    # قواعد معرفة متعددة (كليات) — القيم أسماء مجموعات ChromaDB
+    tenant_chats: dict[int, str] = {}        # معرّف المحادثة ← قاعدة المعرفة
+    tenant_memory_budget_mb: int = 1024      # ميزانية الذاكرة قبل إخلاء LRU
 
     class Config:
         env_file = ".env"
@@ -8,6 +8,7 @@ from telegram import Update
 from app.config import get_settings
 from app.bot import create_bot_app, set_bot_commands
 from app.rag.engine import get_engine
+from app.admission import get_admission, get_usage_ledger
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -40,6 +41,10 @@ async def lifespan(app: FastAPI):
     count = engine.get_collection_count()
     logger.info(f"📚 قاعدة المعرفة: {count} مقطع")
 
+    # حفظ الاستهلاك دورياً
+    usage_ledger = get_usage_ledger()
+    flush_task = asyncio.create_task(usage_ledger.run_flush_loop(get_admission()))
+
     # ربط Webhook
     if settings.webhook_url:
         await bot_app.bot.set_webhook(
@@ -56,6 +61,8 @@ async def lifespan(app: FastAPI):
 
     # --- إيقاف التشغيل ---
     logger.info("🛑 جارٍ إيقاف الخادم...")
+    flush_task.cancel()
+    usage_ledger.flush()
     engine = get_engine()
     await engine.close()
     await bot_app.stop()
@@ -89,6 +96,9 @@ async def health_check():
     return {
         "status": "ok",
         "knowledge_base_chunks": engine.get_collection_count(),
+        "tenants": engine.tenant_metrics(),
+        "load": engine.load_metrics(),
+        "prompt_cache": engine.cache_metrics(),
         "model": settings.openrouter_model,
     }
 
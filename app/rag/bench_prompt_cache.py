@@ -0,0 +1,163 @@
+"""قياس أثر البادئة الثابتة على التخزين المؤقت للموجّه — مقابل خادم محلي يحاكي المزوّد
+
+الاستخدام:
+    python -m app.rag.bench_prompt_cache [--queries 300] [--documents-dir documents/]
+
+تُقطَّع مستندات documents/ محلياً (بدون Embeddings)، ثم تُحاكى أسئلة تسترجع
+مقاطع متداخلة من الأقسام نفسها بترتيب درجات عشوائي. يُرسل كل موجّه بالصيغتين
+(القديمة: ترتيب الدرجات مع الدرجة في الترويسة، والجديدة: ترتيب قانوني) إلى خادم
+وهمي يخزّن البادئات كما يفعل المزوّدون، ويُقرأ cached_tokens من حقل usage.
+"""
+
+import sys
+import json
+import random
+import asyncio
+import argparse
+import logging
+from collections import deque
+from pathlib import Path
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from app.config import get_settings
+from app.rag.ingest import DOCUMENTS_DIR, assign_sections, load_documents
+from app.rag.prompt import build_context, build_messages, parse_usage, supports_cache_control
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# معايير المحاكاة (قريبة من سلوك المزوّدين الشائع)
+_CHARS_PER_TOKEN = 3
+_MIN_CACHED_TOKENS = 1024        # أقل بادئة تُخزَّن
+_CACHE_BLOCK_TOKENS = 128        # تُحسب الإصابة بوحدات كاملة
+_CACHE_SIZE = 64                 # عدد الموجّهات المحفوظة
+_BASE_MS = 300                   # زمن ثابت لكل طلب
+_MS_PER_UNCACHED_TOKEN = 0.25
+_MS_PER_CACHED_TOKEN = 0.02
+_CACHED_PRICE = 0.25             # سعر الرمز المخزّن نسبةً للرمز العادي
+_COMPLETION_TOKENS = 200
+
+
+class CachingProviderStub:
+    """خادم وهمي: cached_tokens = أطول بادئة مشتركة مع موجّه سابق (بوحدات كاملة)"""
+
+    def __init__(self):
+        self._prompts: deque[str] = deque(maxlen=_CACHE_SIZE)
+        self.simulated_ms = 0.0
+
+    @staticmethod
+    def _flatten(messages: list[dict]) -> str:
+        text = []
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                text.append(content)
+            else:
+                text.extend(part["text"] for part in content)
+        return "\x00".join(text)
+
+    @staticmethod
+    def _common_prefix(a: str, b: str) -> int:
+        n = min(len(a), len(b))
+        i = 0
+        while i < n and a[i] == b[i]:
+            i += 1
+        return i
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        prompt = self._flatten(json.loads(request.content)["messages"])
+        prompt_tokens = len(prompt) // _CHARS_PER_TOKEN
+
+        prefix = max((self._common_prefix(prompt, p) for p in self._prompts), default=0)
+        prefix_tokens = prefix // _CHARS_PER_TOKEN
+        cached = 0
+        if prefix_tokens >= _MIN_CACHED_TOKENS:
+            cached = prefix_tokens // _CACHE_BLOCK_TOKENS * _CACHE_BLOCK_TOKENS
+        self._prompts.append(prompt)
+
+        self.simulated_ms += (
+            _BASE_MS
+            + (prompt_tokens - cached) * _MS_PER_UNCACHED_TOKEN
+            + cached * _MS_PER_CACHED_TOKEN
+        )
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "إجابة\nCONFIDENCE: high"}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": _COMPLETION_TOKENS,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        })
+
+
+def legacy_context(docs, scores) -> str:
+    """صيغة السياق السابقة: ترتيب الدرجات مع الدرجة في ترويسة كل مقطع"""
+    return "\n\n---\n\n".join(
+        f"[مقطع {i+1} | المصدر: {doc.metadata.get('source', 'غير محدد')} | التشابه: {score:.2f}]\n{doc.page_content}"
+        for i, (doc, score) in enumerate(zip(docs, scores))
+    )
+
+
+def make_workload(chunks, queries: int, k: int, seed: int = 0):
+    """أسئلة تتركز على أقسام شائعة وتسترجع مقاطع متداخلة بترتيب درجات متغير"""
+    rng = random.Random(seed)
+    sections: dict[str, list] = {}
+    for chunk in chunks:
+        sections.setdefault(chunk.metadata["section"], []).append(chunk)
+    pool = [s for s in sections.values() if len(s) >= k]
+    # شعبية الأقسام غير متساوية (قلة من الأقسام تستقبل معظم الأسئلة)
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+
+    workload = []
+    for q in range(queries):
+        section = rng.choices(pool, weights=weights)[0]
+        docs = rng.sample(section[:k + 2], k)
+        scores = sorted((rng.uniform(0.35, 0.8) for _ in docs), reverse=True)
+        workload.append((f"سؤال تجريبي رقم {q}؟", docs, scores))
+    return workload
+
+
+async def run(workload, canonical: bool) -> dict:
+    stub = CachingProviderStub()
+    prompt_tokens = cached_tokens = 0
+    async with httpx.AsyncClient(transport=httpx.MockTransport(stub)) as client:
+        for question, docs, scores in workload:
+            context = build_context(docs) if canonical else legacy_context(docs, scores)
+            response = await client.post(
+                "https://stub.local/chat/completions",
+                json={"messages": build_messages(question, context)},
+            )
+            usage = parse_usage(response.json())
+            prompt_tokens += usage["prompt_tokens"]
+            cached_tokens += usage["cached_tokens"]
+
+    cost = (prompt_tokens - cached_tokens) + cached_tokens * _CACHED_PRICE
+    return {
+        "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        "avg_ms": stub.simulated_ms / len(workload),
+        "prompt_cost": cost,
+    }
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="قياس التخزين المؤقت للموجّه")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--documents-dir", type=Path, default=DOCUMENTS_DIR)
+    args = parser.parse_args()
+
+    chunks = assign_sections(load_documents(args.documents_dir))
+    workload = make_workload(chunks, args.queries, settings.top_k_results)
+
+    legacy = asyncio.run(run(workload, canonical=False))
+    canonical = asyncio.run(run(workload, canonical=True))
+
+    print(f"\n{len(workload)} سؤال | k={settings.top_k_results} | cache_control: {supports_cache_control()}\n")
+    print(f"{'الصيغة':<12}{'رموز مخزّنة':>14}{'زمن محاكى ms':>16}{'كلفة الموجّه':>16}")
+    for name, r in (("ترتيب الدرجات", legacy), ("ترتيب قانوني", canonical)):
+        print(f"{name:<12}{r['cached_ratio']:>14.1%}{r['avg_ms']:>16.0f}{r['prompt_cost'] / legacy['prompt_cost']:>16.1%}")
+
+
+if __name__ == "__main__":
+    main()
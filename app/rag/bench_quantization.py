@@ -0,0 +1,114 @@
+"""قياس أثر تكميم الـ Embeddings: الذاكرة و recall@k مقارنةً بتخزين float32
+
+الاستخدام:
+    python -m app.rag.bench_quantization [--tenant grad_studies] [--k 5] [--questions questions.txt]
+
+بدون --questions تُستخدم عينة من متجهات المقاطع نفسها كأسئلة (مع استبعاد
+المقطع المطابق من النتائج)، فلا حاجة لمفتاح OpenAI.
+"""
+
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+import numpy as np
+import chromadb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from app.config import get_settings
+from app.rag.quantized import QuantizedIndex, fetch_collection_vectors, relevance_from_vectors
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="قياس الفهرس المضغوط")
+    parser.add_argument("--tenant", default=settings.chroma_collection)
+    parser.add_argument("--k", type=int, default=settings.top_k_results)
+    parser.add_argument("--multiplier", type=int, default=settings.rescore_multiplier)
+    parser.add_argument("--samples", type=int, default=200, help="عدد المقاطع المستخدمة كأسئلة")
+    parser.add_argument("--questions", type=Path, default=None, help="ملف أسئلة (سؤال في كل سطر)")
+    return parser.parse_args()
+
+
+def load_queries(args, vectors: np.ndarray) -> tuple[np.ndarray, list[int | None]]:
+    """متجهات الأسئلة، ومع كل سؤال صف المقطع المطابق له (لاستبعاده) إن وُجد"""
+    if args.questions:
+        from langchain_openai import OpenAIEmbeddings
+
+        settings = get_settings()
+        questions = [q.strip() for q in args.questions.read_text(encoding="utf-8").splitlines() if q.strip()]
+        embeddings = OpenAIEmbeddings(model=settings.embedding_model, openai_api_key=settings.openai_api_key)
+        return np.asarray(embeddings.embed_documents(questions), dtype=np.float32), [None] * len(questions)
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), size=min(args.samples, len(vectors)), replace=False)
+    return vectors[rows], [int(r) for r in rows]
+
+
+def top_k(scores: np.ndarray, k: int, exclude: int | None) -> list[int]:
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    return list(np.argsort(-scores)[:k])
+
+
+def main():
+    args = parse_args()
+    settings = get_settings()
+
+    client = chromadb.PersistentClient(path=settings.chroma_persist_dir)
+    ids, vectors, _ = fetch_collection_vectors(client.get_collection(args.tenant))
+    if not ids:
+        logger.error(f"❌ المجموعة {args.tenant} فارغة")
+        sys.exit(1)
+
+    queries, exclude = load_queries(args, vectors)
+    # نطلب k+1 من الفهرس المضغوط لأن المقطع المطابق قد يكون ضمن النتائج
+    fetch_k = args.k + (0 if args.questions else 1)
+    row_of = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    # recall مع مراعاة التعادل: المقاطع المكررة لها الدرجة نفسها، فأي نتيجة درجتها
+    # الدقيقة لا تقل عن درجة الجار رقم k تُعدّ إصابة
+    exact_scores = [relevance_from_vectors(q, vectors) for q in queries]
+    thresholds = [
+        scores[top_k(scores, args.k, ex)[-1]] - 1e-6
+        for scores, ex in zip(exact_scores, exclude)
+    ]
+
+    float_bytes = vectors.nbytes
+    print(f"\nقاعدة المعرفة: {args.tenant} | {len(ids)} متجه × {vectors.shape[1]} بُعد | "
+          f"{len(queries)} سؤال | k={args.k} | معامل إعادة التقييم={args.multiplier}\n")
+    print(f"{'الصيغة':<10}{'الذاكرة MB':>12}{'التوفير':>10}{'recall تقريبي':>16}{'recall بعد التقييم':>20}{'ms/سؤال':>10}")
+    print(f"{'float32':<10}{float_bytes / 1024 / 1024:>12.2f}{'—':>10}{1.0:>16.3f}{1.0:>20.3f}{'—':>10}")
+
+    for mode in ("int8", "binary"):
+        index = QuantizedIndex.build(ids, vectors, mode)
+        approx_hits = rescored_hits = 0
+        elapsed = 0.0
+
+        for q, ex, exact, threshold in zip(queries, exclude, exact_scores, thresholds):
+            approx = top_k(index.approximate_scores(q), args.k, ex)
+            approx_hits += int((exact[approx] >= threshold).sum())
+
+            start = time.perf_counter()
+            results = index.search(q, fetch_k, rescore_multiplier=args.multiplier)
+            elapsed += time.perf_counter() - start
+            rows = [row_of[doc_id] for doc_id, _ in results if row_of[doc_id] != ex][:args.k]
+            rescored_hits += int((exact[rows] >= threshold).sum()) if rows else 0
+
+        total = len(queries) * args.k
+        saved = 1 - index.resident_bytes / float_bytes
+        print(
+            f"{mode:<10}{index.resident_bytes / 1024 / 1024:>12.2f}{saved:>10.1%}"
+            f"{approx_hits / total:>16.3f}{rescored_hits / total:>20.3f}"
+            f"{elapsed / len(queries) * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,20 @@
 
 import logging
 import json
+import time
 import httpx
-from dataclasses import dataclass
+import numpy as np
+from collections import deque
+from dataclasses import dataclass, field
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain.schema import Document
 from app.config import get_settings
+from app.rag.extractive import extractive_answer
+from app.rag.prompt import build_context, build_messages, parse_usage
+from app.rag.quantized import QuantizedIndex, relevance_from_vectors
+from app.rag.routing import Route
+from app.rag.tenants import KnowledgeBaseRegistry
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -20,6 +29,10 @@ class RAGResult:
     sources: list[str]       # المقاطع المُسترجعة
     similarity_scores: list[float]
     needs_escalation: bool
+    tenant: str = ""
+    routing: list[str] = field(default_factory=list)   # الأقسام التي حُصر فيها البحث
+    usage: dict[str, int] = field(default_factory=dict)  # رموز OpenRouter الفعلية
+    extractive: bool = False  # إجابة مقتطفة بدون LLM (وضع تخفيف الحمل)
 
 
 class RAGEngine:
@@ -30,22 +43,37 @@ class RAGEngine:
             model=settings.embedding_model,
             openai_api_key=settings.openai_api_key,
         )
-        self._vectorstore = Chroma(
-            collection_name=settings.chroma_collection,
-            embedding_function=self._embeddings,
-            persist_directory=settings.chroma_persist_dir,
-        )
+        self.registry = KnowledgeBaseRegistry(self._embeddings)
         self._http_client = httpx.AsyncClient(timeout=60.0)
+
+        # تخفيف الحمل
+        self._inflight = 0
+        self._latencies: deque[tuple[float, float]] = deque(maxlen=256)   # (وقت الانتهاء، الزمن)
+        self._degraded = False
+        self.mode_switches = 0
+        self.extractive_answers = 0
+
+        # التخزين المؤقت للموجّه
+        self._llm_calls = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
         logger.info("✅ محرك RAG جاهز")
 
-    async def query(self, question: str) -> RAGResult:
-        """معالجة سؤال المستخدم"""
+    async def query(self, question: str, tenant: str | None = None) -> RAGResult:
+        """معالجة سؤال المستخدم ضمن قاعدة المعرفة المحددة (الافتراضية إن لم تُحدد)"""
+        tenant = tenant or self.registry.default_tenant
+        start = time.perf_counter()
+
+        result = await self._query(question, tenant)
+        result.tenant = tenant
+
+        self.registry.record_query(tenant, time.perf_counter() - start, result.needs_escalation)
+        return result
 
+    async def _query(self, question: str, tenant: str) -> RAGResult:
         # --- 1. البحث في قاعدة المعرفة ---
-        results = self._vectorstore.similarity_search_with_relevance_scores(
-            question,
-            k=settings.top_k_results,
-        )
+        results, routes = self._retrieve(question, tenant)
+        routing = [route.label for route in routes]
 
         if not results:
             logger.info(f"لم يتم العثور على نتائج للسؤال: {question[:50]}")
@@ -55,6 +83,7 @@ class RAGEngine:
                 sources=[],
                 similarity_scores=[],
                 needs_escalation=True,
+                routing=routing,
             )
 
         docs, scores = zip(*results)
@@ -73,19 +102,37 @@ class RAGEngine:
                 sources=sources,
                 similarity_scores=scores,
                 needs_escalation=True,
+                routing=routing,
             )
 
-        # --- 3. تجهيز السياق ---
-        context_parts = []
-        for i, (doc, score) in enumerate(zip(docs, scores)):
-            src = doc.metadata.get("source", "غير محدد")
-            context_parts.append(
-                f"[مقطع {i+1} | المصدر: {src} | التشابه: {score:.2f}]\n{doc.page_content}"
+        # --- 3. تخفيف الحمل: إجابة مقتطفة محلياً بدلاً من LLM ---
+        if self._should_shed():
+            answer, matched = extractive_answer(
+                question, list(docs), scores, max_sentences=settings.extractive_sentences,
+            )
+            self.extractive_answers += 1
+            confident = matched and best_score >= settings.similarity_threshold + settings.shed_confident_margin
+            return RAGResult(
+                answer=answer,
+                confidence="medium",
+                sources=sources,
+                similarity_scores=scores,
+                needs_escalation=not confident,
+                routing=routing,
+                extractive=True,
             )
-        context = "\n\n---\n\n".join(context_parts)
 
-        # --- 4. توليد الإجابة عبر Kimi 2.5 ---
-        answer, confidence = await self._generate_answer(question, context)
+        # --- 4. تجهيز السياق (ترتيب ثابت لتطابق بادئة الموجّه) ---
+        context = build_context(list(docs))
+
+        # --- 5. توليد الإجابة عبر Kimi 2.5 ---
+        self._inflight += 1
+        start = time.perf_counter()
+        try:
+            answer, confidence, usage = await self._generate_answer(question, context)
+        finally:
+            self._inflight -= 1
+            self._latencies.append((time.monotonic(), time.perf_counter() - start))
 
         needs_escalation = confidence == "low"
 
@@ -95,34 +142,148 @@ class RAGEngine:
             sources=sources,
             similarity_scores=scores,
             needs_escalation=needs_escalation,
+            routing=routing,
+            usage=usage,
         )
 
-    async def _generate_answer(self, question: str, context: str) -> tuple[str, str]:
-        """توليد الإجابة عبر OpenRouter (Kimi 2.5)"""
-
-        system_prompt = """أنت مساعد ذكي متخصص في الإجابة عن تساؤلات الدراسات العليا.
-
-## القواعد:
-1. أجب **فقط** بناءً على المعلومات الموجودة في السياق المُقدم أدناه.
-2. إذا لم تجد الإجابة في السياق، قل ذلك بوضوح ولا تختلق معلومات.
-3. أجب بالعربية بأسلوب واضح ومباشر.
-4. إذا كان السؤال يحتاج تفاصيل غير موجودة في السياق، اذكر ما تعرفه واقترح التواصل مع المختص.
-
-## التقييم:
-في نهاية إجابتك، أضف سطراً جديداً بالتنسيق التالي فقط:
-CONFIDENCE: high أو medium أو low
-
-- high: الإجابة كاملة وواضحة من السياق
-- medium: الإجابة جزئية أو تحتاج تأكيد
-- low: لم تجد معلومات كافية"""
+    def _recent_latency(self) -> float:
+        """متوسط زمن LLM خلال النافذة الحديثة (0 إن لم توجد قياسات حديثة)"""
+        cutoff = time.monotonic() - settings.shed_latency_window_seconds
+        recent = [latency for finished, latency in self._latencies if finished >= cutoff]
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def _should_shed(self) -> bool:
+        """قرار التحول إلى الوضع المقتطف، مع هامش رجوع (hysteresis) لتجنب التذبذب
+
+        يُدخل الوضع عند بلوغ عدد الطلبات المتزامنة أو متوسط الزمن الحديث الحد،
+        ويُخرج منه عند انخفاضهما إلى النصف. بما أن الوضع المقتطف لا يستدعي LLM
+        تتقادم قياسات الزمن خارج النافذة فيعود المحرك تلقائياً للتوليد.
+        """
+        latency = self._recent_latency()
+        if self._degraded:
+            overloaded = (
+                self._inflight >= settings.shed_max_inflight / 2
+                or latency >= settings.shed_latency_seconds / 2
+            )
+        else:
+            overloaded = (
+                self._inflight >= settings.shed_max_inflight
+                or latency >= settings.shed_latency_seconds
+            )
 
-        user_message = f"""## السياق من قاعدة المعرفة:
-{context}
+        if overloaded != self._degraded:
+            self._degraded = overloaded
+            self.mode_switches += 1
+            if overloaded:
+                logger.warning(
+                    f"⚡ التحول إلى الإجابات المقتطفة (بدون LLM) | متزامن: {self._inflight} | "
+                    f"متوسط الزمن: {latency:.1f} ث"
+                )
+            else:
+                logger.info(
+                    f"✅ العودة إلى التوليد عبر LLM | متزامن: {self._inflight} | "
+                    f"متوسط الزمن: {latency:.1f} ث"
+                )
+        return self._degraded
+
+    def load_metrics(self) -> dict:
+        """حالة تخفيف الحمل (للحالة و /health)"""
+        return {
+            "degraded": self._degraded,
+            "inflight": self._inflight,
+            "recent_llm_latency": round(self._recent_latency(), 2),
+            "mode_switches": self.mode_switches,
+            "extractive_answers": self.extractive_answers,
+        }
+
+    def _retrieve(self, question: str, tenant: str) -> tuple[list[tuple[Document, float]], list[Route]]:
+        """البحث على مرحلتين: توجيه إلى أقرب الأقسام ثم البحث في مقاطعها فقط"""
+        try:
+            vectorstore = self.registry.get(tenant)
+        except KeyError as e:
+            logger.warning(f"⚠️ {e.args[0]} — شغّل التجهيز أولاً")
+            return [], []
+        quantized = self.registry.get_quantized(tenant)
+        route_index = self.registry.get_routes(tenant)
+
+        if quantized is None and route_index is None:
+            return vectorstore.similarity_search_with_relevance_scores(
+                question,
+                k=settings.top_k_results,
+            ), []
+
+        query_vector = self._embeddings.embed_query(question)
+        routes = route_index.route(query_vector) if route_index is not None else []
+        if routes:
+            logger.info("🧭 التوجيه: " + " | ".join(route.label for route in routes))
+
+        if quantized is not None:
+            rows = quantized.rows_for([i for route in routes for i in route.ids]) if routes else None
+            return self._search_quantized(vectorstore, quantized, query_vector, rows), routes
+
+        if routes:
+            return self._search_routed(vectorstore, query_vector, routes), routes
+
+        hits = vectorstore.similarity_search_by_vector_with_relevance_scores(
+            query_vector,
+            k=settings.top_k_results,
+        )
+        # تُرجع LangChain هنا المسافة، فنحوّلها لدرجة التشابه نفسها المستخدمة في العتبة
+        relevance = vectorstore._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in hits], routes
+
+    def _search_routed(
+        self,
+        vectorstore: Chroma,
+        query_vector: list[float],
+        routes: list[Route],
+    ) -> list[tuple[Document, float]]:
+        """تقييم مقاطع الأقسام المُختارة فقط: جلبها بالمعرّفات ثم حساب التشابه مباشرة
+
+        الكلفة تتناسب مع عدد مقاطع الأقسام لا مع حجم المجموعة، بخلاف مرشّح where
+        في Chroma الذي يفحص البيانات الوصفية ثم يبحث في رسم HNSW كاملاً.
+        """
+        found = vectorstore._collection.get(
+            ids=[doc_id for route in routes for doc_id in route.ids],
+            include=["embeddings", "documents", "metadatas"],
+        )
+        if not found["ids"]:
+            return []
 
-## سؤال المستخدم:
-{question}
+        scores = relevance_from_vectors(
+            np.asarray(query_vector, dtype=np.float32),
+            np.asarray(found["embeddings"], dtype=np.float32),
+        )
+        top = np.argsort(-scores)[:settings.top_k_results]
+        return [
+            (Document(page_content=found["documents"][i], metadata=found["metadatas"][i] or {}), float(scores[i]))
+            for i in top
+        ]
+
+    def _search_quantized(
+        self,
+        vectorstore: Chroma,
+        quantized: QuantizedIndex,
+        query_vector: list[float],
+        rows: np.ndarray | None = None,
+    ) -> list[tuple[Document, float]]:
+        """بحث على الفهرس المضغوط ثم جلب نصوص المقاطع من ChromaDB بالمعرّفات"""
+        hits = quantized.search(query_vector, k=settings.top_k_results, rows=rows)
+        if not hits:
+            return []
+
+        found = vectorstore._collection.get(
+            ids=[doc_id for doc_id, _ in hits],
+            include=["documents", "metadatas"],
+        )
+        by_id = {
+            doc_id: Document(page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        return [(by_id[doc_id], score) for doc_id, score in hits if doc_id in by_id]
 
-أجب على السؤال بناءً على السياق أعلاه فقط."""
+    async def _generate_answer(self, question: str, context: str) -> tuple[str, str, dict[str, int]]:
+        """توليد الإجابة عبر OpenRouter (Kimi 2.5)"""
 
         try:
             response = await self._http_client.post(
@@ -133,10 +294,7 @@ CONFIDENCE: high أو medium أو low
                 },
                 json={
                     "model": settings.openrouter_model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_message},
-                    ],
+                    "messages": build_messages(question, context),
                     "temperature": 0.3,
                     "max_tokens": 1500,
                 },
@@ -144,6 +302,8 @@ CONFIDENCE: high أو medium أو low
             response.raise_for_status()
             data = response.json()
             full_answer = data["choices"][0]["message"]["content"].strip()
+            usage = parse_usage(data)
+            self._record_cache(usage)
 
             # استخراج مستوى الثقة
             confidence = "medium"
@@ -155,20 +315,42 @@ CONFIDENCE: high أو medium أو low
                     answer = full_answer.replace(tag, "").strip()
                     break
 
-            return answer, confidence
+            return answer, confidence, usage
 
         except Exception as e:
             logger.error(f"خطأ في توليد الإجابة: {e}")
-            return "حدث خطأ أثناء معالجة سؤالك. يرجى المحاولة لاحقاً.", "low"
+            return "حدث خطأ أثناء معالجة سؤالك. يرجى المحاولة لاحقاً.", "low", {}
+
+    def _record_cache(self, usage: dict[str, int]):
+        self._llm_calls += 1
+        self._prompt_tokens += usage["prompt_tokens"]
+        self._cached_tokens += usage["cached_tokens"]
+        if usage["prompt_tokens"]:
+            logger.info(
+                f"💾 رموز الموجّه من التخزين المؤقت: {usage['cached_tokens']}/{usage['prompt_tokens']}"
+            )
+
+    def cache_metrics(self) -> dict:
+        """نسبة رموز الموجّه المقروءة من التخزين المؤقت لدى المزوّد"""
+        return {
+            "llm_calls": self._llm_calls,
+            "prompt_tokens": self._prompt_tokens,
+            "cached_tokens": self._cached_tokens,
+            "cached_ratio": round(self._cached_tokens / self._prompt_tokens, 3) if self._prompt_tokens else 0.0,
+        }
 
-    def get_collection_count(self) -> int:
+    def get_collection_count(self, tenant: str | None = None) -> int:
         """عدد المقاطع في قاعدة المعرفة"""
         try:
-            collection = self._vectorstore._collection
+            collection = self.registry.get(tenant or self.registry.default_tenant)._collection
             return collection.count()
         except Exception:
             return 0
 
+    def tenant_metrics(self) -> dict[str, dict]:
+        """مقاييس كل قاعدة معرفة"""
+        return self.registry.snapshot()
+
     async def close(self):
         await self._http_client.aclose()
 
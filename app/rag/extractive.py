@@ -0,0 +1,92 @@
+"""إجابة مقتطفة بدون LLM — اختيار أقرب الجمل من المقاطع المسترجعة مع ذكر المصدر"""
+
+import re
+import math
+from langchain.schema import Document
+
+# التشكيل والتطويل
+_DIACRITICS = re.compile("[\u064b-\u0652\u0670\u0640]")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.؟?!:])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+_STOPWORDS = {
+    "في", "من", "علي", "عن", "الى", "الي", "ما", "ماذا", "هل", "كيف", "متي", "كم", "لماذا",
+    "هو", "هي", "هذا", "هذه", "ذلك", "تلك", "التي", "الذي", "او", "ام", "ثم", "قد", "لا",
+    "ان", "انا", "نحن", "مع", "بعد", "قبل", "عند", "كل", "اي", "يجب", "يمكن", "لي", "لك",
+}
+
+# أقصر وأطول جملة تُعرض
+_MIN_SENTENCE_CHARS = 20
+_MAX_SENTENCE_CHARS = 400
+
+
+def _normalize(text: str) -> str:
+    text = _DIACRITICS.sub("", text)
+    text = re.sub("[أإآ]", "ا", text)
+    return text.replace("ة", "ه").replace("ى", "ي")
+
+
+def _terms(text: str) -> set[str]:
+    """كلمات مُطبّعة بلا أدوات ربط، مع حذف "ال" و"و" المتصلة"""
+    terms = set()
+    for word in _WORD.findall(_normalize(text)):
+        for prefix in ("وال", "بال", "لل", "ال", "و"):
+            if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+                word = word[len(prefix):]
+                break
+        if len(word) >= 2 and word not in _STOPWORDS:
+            terms.add(word)
+    return terms
+
+
+def extractive_answer(
+    question: str,
+    docs: list[Document],
+    scores: list[float],
+    max_sentences: int = 3,
+) -> tuple[str, bool]:
+    """أفضل الجمل حسب تطابق كلمات السؤال (موزونة بالندرة ودرجة المقطع)
+
+    تُرجع النص ومعه هل وُجد تطابق فعلي مع كلمات السؤال.
+    """
+    question_terms = _terms(question)
+
+    candidates = []   # (درجة، ترتيب المقطع، ترتيب الجملة، الجملة، كلماتها)
+    for d, doc in enumerate(docs):
+        for s, sentence in enumerate(_SENTENCE_SPLIT.split(doc.page_content)):
+            sentence = sentence.strip()
+            if len(sentence) >= _MIN_SENTENCE_CHARS:
+                candidates.append([0.0, d, s, sentence[:_MAX_SENTENCE_CHARS], _terms(sentence)])
+    if not candidates:
+        return "", False
+
+    # ندرة الكلمة بين الجمل المرشحة (IDF)
+    df: dict[str, int] = {}
+    for cand in candidates:
+        for term in cand[4] & question_terms:
+            df[term] = df.get(term, 0) + 1
+    for cand in candidates:
+        overlap = sum(math.log(1 + len(candidates) / df[t]) for t in cand[4] & question_terms)
+        cand[0] = overlap * (0.5 + scores[cand[1]])
+
+    best = sorted(candidates, key=lambda c: c[0], reverse=True)[:max_sentences]
+    matched = best[0][0] > 0
+    if not matched:
+        # لا تطابق في الكلمات: نعرض بداية أقرب مقطع دلالياً فيه جمل صالحة
+        nearest = candidates[0][1]
+        best = [c for c in candidates if c[1] == nearest][:max_sentences]
+
+    # عرض الجمل بترتيب ورودها في المستندات
+    best.sort(key=lambda c: (c[1], c[2]))
+    lines = [f"• {c[3]}" for c in best]
+
+    cited = []
+    for d in dict.fromkeys(c[1] for c in best):
+        meta = docs[d].metadata
+        ref = meta.get("source", "غير محدد")
+        if meta.get("page"):
+            ref += f" (ص {meta['page']})"
+        if ref not in cited:
+            cited.append(ref)
+
+    return "\n".join(lines) + "\n\n📄 المصدر: " + "، ".join(cited), matched
@@ -1,9 +1,17 @@
-"""تجهيز المستندات — تقطيع وتخزين في ChromaDB"""
+"""تجهيز المستندات — استخراج (TXT/PDF/DOCX) وتقطيع وتخزين في ChromaDB"""
 
 import os
+import re
 import sys
+import argparse
+import time
 import logging
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterator
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -13,65 +21,418 @@ from langchain.schema import Document
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
 from app.config import get_settings
+from app.rag.quantized import QUANTIZATION_MODES, build_quantized_index
+from app.rag.routing import build_route_index
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 logger = logging.getLogger(__name__)
 
 DOCUMENTS_DIR = Path(__file__).resolve().parent.parent.parent / "documents"
 
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
 
-def load_text_files() -> list[Document]:
-    """تحميل جميع ملفات .txt من مجلد documents/"""
-    documents = []
-
-    if not DOCUMENTS_DIR.exists():
-        logger.error(f"❌ مجلد المستندات غير موجود: {DOCUMENTS_DIR}")
-        return documents
-
-    txt_files = list(DOCUMENTS_DIR.glob("*.txt"))
-    if not txt_files:
-        logger.warning("⚠️ لا توجد ملفات .txt في مجلد documents/")
-        return documents
-
-    for filepath in txt_files:
-        try:
-            content = filepath.read_text(encoding="utf-8")
-            if content.strip():
-                doc = Document(
-                    page_content=content,
-                    metadata={
-                        "source": filepath.name,
-                        "file_path": str(filepath),
-                    }
-                )
-                documents.append(doc)
-                logger.info(f"📄 تم تحميل: {filepath.name} ({len(content)} حرف)")
-        except Exception as e:
-            logger.error(f"❌ خطأ في قراءة {filepath.name}: {e}")
+# فاصل الصفحات في ملفات .txt المُحوّلة يدوياً: "--- الصفحة 3 ---" (يسبق نص الصفحة)
+_TXT_PAGE_MARKER = re.compile(r"^[\s#]*---\s*الصفحة\s+([\d٠-٩]+)\s*---\s*$")
 
-    logger.info(f"📚 إجمالي المستندات المُحمّلة: {len(documents)}")
-    return documents
+# حجم الكتلة عند غياب فواصل الصفحات أو طول الصفحة (ملفات txt و docx)
+# الكتلة ليست صفحة: لا تُسجَّل رقماً للصفحة ولا تُستشهد به
+_BLOCK_CHARS = 8000
 
+# علامات الاتجاه (RTL/LTR) والوصل غير المرئية التي يخلّفها التحويل
+_BIDI_CONTROLS = re.compile("[\u061c\u200b-\u200f\u202a-\u202e\u2066-\u2069\ufeff]")
+_TATWEEL = "\u0640"
+
+# أسطر ترقيم الصفحات: "12" / "صفحة 3 من 24" / "Page 3 of 24" / "- 5 -"
+_PAGE_NUMBER_LINE = re.compile(
+    r"^[\s\-–—|]*(?:(?:ال)?صفحة|page)?\s*[\d٠-٩]+\s*(?:(?:من|/|of)\s*[\d٠-٩]+)?[\s\-–—|]*$",
+    re.IGNORECASE,
+)
+# رقم الصفحة في آخر سطر الترويسة/التذييل: "دليل الطالب - 12" / "... 3 من 24"
+_TRAILING_PAGE_NUMBER = re.compile(r"[\d٠-٩]+\s*(?:(?:من|/|of)\s*[\d٠-٩]+)?[\s\-–—|]*$", re.IGNORECASE)
+
+# عناوين الأبواب والفصول التي تبدأ قسماً جديداً في فهرس التوجيه
+_SECTION_HEADING = re.compile(r"^\s*(?:الباب|الفصل)\s+(?!الدراسي)[^\n.]{1,60}", re.MULTILINE)
+# سطر فهرس محتويات: عنوان ينتهي برقم صفحة ("الفصل الثالث: القبول ..... 23")
+_TOC_LINE = re.compile(r"[\s.…:\-–—]*[\d٠-٩]+\s*$")
+# عدد العناوين في صفحة واحدة الذي يدل على قائمة محتويات لا على بداية فصل
+_TOC_MIN_HEADINGS = 3
+# يُبحث عن العنوان في بداية النص الجديد للمقطع فقط (بعد التداخل مع المقطع السابق)
+_SECTION_HEAD_CHARS = 200
+# حدود حجم القسم بعدد المقاطع
+_SECTION_MIN_CHUNKS = 4
+_SECTION_MAX_CHUNKS = 24
+
+# أسطر المواد والبنود — محتوى وإن تكرر شكلها في أطراف الصفحات
+_ARTICLE_HEADING = re.compile(r"^\s*(?:ال)?(?:مادة|بند|فقرة)\b|^\s*article\b", re.IGNORECASE)
+
+# عدد الأسطر التي تُفحص في أعلى وأسفل كل صفحة بحثاً عن الترويسات والتذييلات
+_FURNITURE_LINES = 2
+# عدد مرات الظهور السابقة في الموضع نفسه قبل اعتبار السطر ترويسة
+_FURNITURE_MIN_REPEATS = 2
+# ونسبتها من الصفحات السابقة (الترويسة الحقيقية تظهر في معظم الصفحات)
+_FURNITURE_MIN_SHARE = 0.5
+
+
+@dataclass
+class FileIngestResult:
+    """نتيجة معالجة ملف واحد داخل عملية عاملة"""
+    name: str
+    chunks: list[Document] = field(default_factory=list)
+    pages: int = 0
+    chars: int = 0
+    seconds: float = 0.0
+    error: str = ""
+
+
+# ══════════════════════════════════════
+#  تنظيف النص العربي
+# ══════════════════════════════════════
+
+def clean_arabic_text(text: str) -> str:
+    """إزالة مخلّفات الاتجاه وإصلاح الحروف المركّبة وتوحيد المسافات"""
+    # أشكال العرض (ﻻ، ﷲ، ﺍ...) ← الحروف الأساسية
+    text = unicodedata.normalize("NFKC", text)
+    text = _BIDI_CONTROLS.sub("", text)
+    text = text.replace(_TATWEEL, "")
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+class _PageFurnitureFilter:
+    """حذف الترويسات والتذييلات المتكررة وأرقام الصفحات أثناء تدفق الصفحات
+
+    تُحذف أسطر أرقام الصفحات من أطراف الصفحة فقط. والسطر في أعلى/أسفل الصفحة
+    يُعدّ ترويسة إذا تكرر في الموضع نفسه (الطرف وترتيب السطر فيه) في نسبة معتبرة
+    من الصفحات السابقة، بعد تجاهل رقم الصفحة في آخره فقط. لا تُحذف عناوين
+    الأبواب والمواد، ولا أي سطر من صفحة قصيرة كل أسطرها أطراف.
+    """
+
+    def __init__(self):
+        self._seen: Counter[tuple[int, str]] = Counter()
+        self._pages = 0
+
+    @staticmethod
+    def _is_content(line: str) -> bool:
+        return bool(_SECTION_HEADING.match(line) or _ARTICLE_HEADING.match(line))
+
+    def __call__(self, text: str) -> str:
+        lines = text.split("\n")
+        # أرقام الصفحات تُحذف من الأطراف فقط ("12" في وسط الصفحة قد تكون خلية جدول)
+        non_empty = [i for i, ln in enumerate(lines) if ln.strip()]
+        edges = set(non_empty[:_FURNITURE_LINES] + non_empty[-_FURNITURE_LINES:])
+        lines = [ln for i, ln in enumerate(lines) if i not in edges or not _PAGE_NUMBER_LINE.match(ln)]
+
+        non_empty = [i for i, ln in enumerate(lines) if ln.strip()]
+        # الموضع: 0، 1 من الأعلى و -1، -2 من الأسفل
+        positions = {i: -1 - n for n, i in enumerate(reversed(non_empty[-_FURNITURE_LINES:]))}
+        positions.update({i: n for n, i in enumerate(non_empty[:_FURNITURE_LINES])})
+        has_body = len(non_empty) > 2 * _FURNITURE_LINES
+
+        drop = set()
+        for i, position in positions.items():
+            line = lines[i].strip()
+            if self._is_content(line):
+                continue
+            key = (position, _TRAILING_PAGE_NUMBER.sub("#", line))
+            seen = self._seen[key]
+            if has_body and seen >= _FURNITURE_MIN_REPEATS and seen >= _FURNITURE_MIN_SHARE * self._pages:
+                drop.add(i)
+            self._seen[key] += 1
+        self._pages += 1
+
+        return "\n".join(ln for i, ln in enumerate(lines) if i not in drop)
+
+
+# ══════════════════════════════════════
+#  استخراج الصفحات (تدفقياً)
+# ══════════════════════════════════════
+
+def _iter_txt_pages(filepath: Path) -> Iterator[tuple[int | None, str]]:
+    """قراءة ملف نصي سطراً بسطر وتقسيمه عند فواصل الصفحات (رقم الصفحة من الفاصل)"""
+    page: int | None = None
+    buffer: list[str] = []
+    size = 0
+    with filepath.open(encoding="utf-8") as f:
+        for line in f:
+            marker = _TXT_PAGE_MARKER.match(line)
+            if marker:
+                if buffer:
+                    yield page, "".join(buffer)
+                page, buffer, size = int(marker.group(1)), [], 0
+                continue
+            buffer.append(line)
+            size += len(line)
+            # صفحة طويلة أو ملف بلا فواصل: نقطع عند أول سطر فارغ بعد تجاوز حجم الكتلة
+            if size >= _BLOCK_CHARS and not line.strip():
+                yield page, "".join(buffer)
+                buffer, size = [], 0
+    if buffer:
+        yield page, "".join(buffer)
+
+
+def _iter_pdf_pages(filepath: Path) -> Iterator[tuple[int | None, str]]:
+    """استخراج نص PDF صفحةً صفحة"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(filepath)
+    for page_no, page in enumerate(reader.pages, start=1):
+        yield page_no, page.extract_text() or ""
+
+
+# فواصل صفحات DOCX: ما حسبه Word عند آخر حفظ، أو الفواصل اليدوية (Ctrl+Enter)
+_DOCX_RENDERED_BREAK = "./w:lastRenderedPageBreak"
+_DOCX_HARD_BREAK = './w:br[@w:type="page"]'
+
+
+def _docx_break_position(paragraph, xpath: str) -> str | None:
+    """موضع فاصل الصفحة في الفقرة: "before" إن سبق نصها، "after" إن تلاه، وإلا None"""
+    if xpath == _DOCX_HARD_BREAK and paragraph.paragraph_format.page_break_before:
+        return "before"
+    seen_text = False
+    for run in paragraph.runs:
+        if run._r.xpath(xpath):
+            return "after" if seen_text else "before"
+        seen_text = seen_text or bool(run.text.strip())
+    return None
+
+
+def _iter_docx_pages(filepath: Path) -> Iterator[tuple[int | None, str]]:
+    """استخراج نص DOCX (فقرات وجداول بالترتيب) مقسّماً عند فواصل الصفحات
+
+    تُعتمد فواصل Word المحسوبة إن وُجدت (تشمل كل حدود الصفحات)، وإلا الفواصل
+    اليدوية. المستند بلا أي فواصل لا تُرقَّم صفحاته.
+    """
+    from docx import Document as DocxDocument
+    from docx.table import Table
+
+    document = DocxDocument(str(filepath))
+    body = document.element.body
+    if body.xpath(".//w:lastRenderedPageBreak"):
+        xpath = _DOCX_RENDERED_BREAK
+    elif body.xpath('.//w:br[@w:type="page"] | .//w:pageBreakBefore'):
+        xpath = _DOCX_HARD_BREAK
+    else:
+        xpath = None
+    page: int | None = 1 if xpath else None
+    page_started = False      # هل بدأ نص في الصفحة الحالية (لتجاهل فاصل في أول المستند)
+
+    buffer: list[str] = []
+    size = 0
+    for block in document.iter_inner_content():
+        position = None
+        if isinstance(block, Table):
+            text = "\n".join(
+                " | ".join(cell.text.strip() for cell in row.cells)
+                for row in block.rows
+            )
+        else:
+            text = block.text
+            if xpath:
+                position = _docx_break_position(block, xpath)
+
+        if position == "before" and page_started:
+            if buffer:
+                yield page, "\n".join(buffer)
+                buffer, size = [], 0
+            page, page_started = page + 1, False
+
+        buffer.append(text)
+        size += len(text)
+        page_started = page_started or bool(text.strip())
+        if position == "after" or size >= _BLOCK_CHARS:
+            yield page, "\n".join(buffer)
+            buffer, size = [], 0
+            if position == "after":
+                page, page_started = page + 1, False
+    if buffer:
+        yield page, "\n".join(buffer)
+
+
+_PAGE_READERS = {
+    ".txt": _iter_txt_pages,
+    ".pdf": _iter_pdf_pages,
+    ".docx": _iter_docx_pages,
+}
 
-def chunk_documents(documents: list[Document]) -> list[Document]:
-    """تقطيع المستندات إلى مقاطع"""
-    settings = get_settings()
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap,
+# ══════════════════════════════════════
+#  المعالجة داخل العمليات العاملة
+# ══════════════════════════════════════
+
+def _make_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", ".", "،", "؟", "!", " "],
         length_function=len,
     )
 
-    chunks = splitter.split_documents(documents)
-    logger.info(f"✂️ تم التقطيع إلى {len(chunks)} مقطع")
+
+def process_file(filepath: Path, chunk_size: int, chunk_overlap: int) -> FileIngestResult:
+    """استخراج ملف واحد وتنظيفه وتقطيعه صفحةً صفحة (يعمل داخل عملية عاملة)"""
+    result = FileIngestResult(name=filepath.name)
+    start = time.perf_counter()
+
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    strip_furniture = _PageFurnitureFilter()
+    read_pages = _PAGE_READERS[filepath.suffix.lower()]
+
+    try:
+        pages: set[int] = set()
+        for page_no, raw in read_pages(filepath):
+            text = clean_arabic_text(raw)
+            # الترويسات والتذييلات تخص الصفحات الحقيقية لا الكتل
+            if page_no is not None:
+                pages.add(page_no)
+                text = clean_arabic_text(strip_furniture(text))
+            if not text:
+                continue
+            result.chars += len(text)
+            for piece in splitter.split_text(text):
+                metadata = {
+                    "source": filepath.name,
+                    "file_path": str(filepath),
+                    "chunk": len(result.chunks),
+                }
+                if page_no is not None:
+                    metadata["page"] = page_no
+                result.chunks.append(Document(page_content=piece, metadata=metadata))
+        result.pages = len(pages)
+    except Exception as e:
+        # ملف تالف جزئياً: لا نُدخل مقاطعه المبتورة في الفهرس
+        result.error = str(e)
+        result.chunks = []
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def load_documents(documents_dir: Path = DOCUMENTS_DIR, workers: int | None = None) -> list[Document]:
+    """تحميل ملفات TXT/PDF/DOCX من مجلد المستندات بالتوازي وإرجاع المقاطع"""
+    settings = get_settings()
+    chunks: list[Document] = []
+
+    if not documents_dir.exists():
+        logger.error(f"❌ مجلد المستندات غير موجود: {documents_dir}")
+        return chunks
+
+    files = sorted(
+        p for p in documents_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+    if not files:
+        logger.warning(f"⚠️ لا توجد ملفات ({', '.join(SUPPORTED_EXTENSIONS)}) في {documents_dir}")
+        return chunks
+
+    workers = workers or settings.ingest_workers or os.cpu_count() or 1
+    workers = min(workers, len(files))
+    logger.info(f"⚙️ معالجة {len(files)} ملف عبر {workers} عملية")
+
+    start = time.perf_counter()
+    results: list[FileIngestResult] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(process_file, fp, settings.chunk_size, settings.chunk_overlap)
+            for fp in files
+        ]
+        for future in as_completed(futures):
+            res = future.result()
+            results.append(res)
+            if res.error:
+                logger.error(f"❌ خطأ في قراءة {res.name}: {res.error}")
+            else:
+                logger.info(
+                    f"📄 {res.name}: " + (f"{res.pages} صفحة، " if res.pages else "") + f"{res.chars} حرف، "
+                    f"{len(res.chunks)} مقطع ⏱️ {res.seconds:.2f} ث"
+                )
+
+    # ترتيب ثابت بغض النظر عن ترتيب انتهاء العمليات
+    for res in sorted(results, key=lambda r: r.name):
+        if not res.error:
+            chunks.extend(res.chunks)
+
+    elapsed = time.perf_counter() - start
+    cpu_total = sum(r.seconds for r in results)
+    loaded = sum(1 for r in results if r.chunks)
+    logger.info(f"📚 إجمالي المستندات المُحمّلة: {loaded} ({len(chunks)} مقطع)")
+    logger.info(f"⏱️ زمن الاستخراج: {elapsed:.2f} ث (مجموع أزمنة الملفات {cpu_total:.2f} ث)")
     return chunks
 
 
-def store_in_chromadb(chunks: list[Document]):
-    """تخزين المقاطع في ChromaDB"""
+def _overlap_length(previous: str, current: str, limit: int) -> int:
+    """طول بداية المقطع المكررة من نهاية المقطع السابق (تداخل التقطيع، حتى limit)"""
+    for size in range(min(len(previous), len(current), limit), 0, -1):
+        if previous.endswith(current[:size]):
+            return size
+    return 0
+
+
+def _headings(text: str) -> list[re.Match]:
+    """عناوين الأبواب/الفصول في النص، دون أسطر فهرس المحتويات المنتهية برقم صفحة"""
+    found = []
+    for match in _SECTION_HEADING.finditer(text):
+        line_end = text.find("\n", match.start())
+        line = text[match.start():line_end if line_end != -1 else len(text)]
+        if not _TOC_LINE.search(line):
+            found.append(match)
+    return found
+
+
+def assign_sections(chunks: list[Document]) -> list[Document]:
+    """تقسيم مقاطع كل مستند إلى أقسام متجاورة لفهرس التوجيه
+
+    يبدأ قسم جديد عند عنوان باب/فصل في بداية النص الجديد للمقطع (إن بلغ القسم
+    الحالي حداً أدنى) أو عند بلوغ الحد الأقصى، فتبقى الأقسام متقاربة الحجم حتى في
+    المستندات بلا عناوين. لا تُعدّ عناوين التداخل ولا صفحات فهرس المحتويات (عدة
+    عناوين في صفحة واحدة) بدايات أقسام.
+    """
+    def page_key(i: int, chunk: Document):
+        page = chunk.metadata.get("page")
+        return (chunk.metadata["source"], page) if page else (chunk.metadata["source"], -i)
+
+    # عدد العناوين المختلفة في كل صفحة (أو مقطع لملفات بلا صفحات)
+    page_headings: dict[tuple, set[str]] = {}
+    for i, chunk in enumerate(chunks):
+        page_headings.setdefault(page_key(i, chunk), set()).update(
+            m.group(0).strip() for m in _headings(chunk.page_content)
+        )
+
+    overlap = get_settings().chunk_overlap
+    source, number, size, title = None, 0, 0, ""
+    previous = ""
+    for i, chunk in enumerate(chunks):
+        text = chunk.page_content
+        if chunk.metadata["source"] != source:
+            previous = ""
+        start = _overlap_length(previous, text, overlap) if previous else 0
+        previous = text
+
+        heading = None
+        if len(page_headings[page_key(i, chunk)]) < _TOC_MIN_HEADINGS:
+            heading = next(
+                (m for m in _headings(text) if start <= m.start() < start + _SECTION_HEAD_CHARS),
+                None,
+            )
+
+        if chunk.metadata["source"] != source:
+            source, number, size = chunk.metadata["source"], 0, 0
+            title = heading.group(0).strip() if heading else ""
+        elif size >= _SECTION_MAX_CHUNKS or (heading and size >= _SECTION_MIN_CHUNKS):
+            number, size = number + 1, 0
+            title = heading.group(0).strip() if heading else ""
+        size += 1
+        chunk.metadata["section"] = f"{source}#{number}"
+        if title:
+            chunk.metadata["section_title"] = title
+    return chunks
+
+
+def store_in_chromadb(chunks: list[Document], tenant: str | None = None):
+    """تخزين المقاطع في ChromaDB ضمن مجموعة قاعدة المعرفة المحددة"""
     settings = get_settings()
+    tenant = tenant or settings.chroma_collection
 
     embeddings = OpenAIEmbeddings(
         model=settings.embedding_model,
@@ -82,12 +443,12 @@ def store_in_chromadb(chunks: list[Document]):
     persist_dir = settings.chroma_persist_dir
     os.makedirs(persist_dir, exist_ok=True)
 
-    logger.info("🧠 جارٍ إنشاء Embeddings وتخزينها...")
+    logger.info(f"🧠 جارٍ إنشاء Embeddings وتخزينها في {tenant}...")
 
     vectorstore = Chroma.from_documents(
         documents=chunks,
         embedding=embeddings,
-        collection_name=settings.chroma_collection,
+        collection_name=tenant,
         persist_directory=persist_dir,
     )
 
@@ -96,23 +457,74 @@ def store_in_chromadb(chunks: list[Document]):
     return vectorstore
 
 
+def store_quantized(vectorstore, tenant: str | None = None, mode: str | None = None):
+    """كتابة الفهرس المضغوط (int8/binary) ومتجهات float32 لإعادة التقييم"""
+    settings = get_settings()
+    tenant = tenant or settings.chroma_collection
+    mode = mode or settings.embedding_quantization
+    return build_quantized_index(vectorstore._collection, tenant, mode)
+
+
+def parse_args() -> argparse.Namespace:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="تجهيز قاعدة المعرفة")
+    parser.add_argument(
+        "--tenant",
+        default=settings.chroma_collection,
+        help="اسم قاعدة المعرفة (مجموعة ChromaDB) — الافتراضي: %(default)s",
+    )
+    parser.add_argument(
+        "--documents-dir",
+        type=Path,
+        default=None,
+        help="مجلد المستندات — الافتراضي: documents/<tenant> (وللقاعدة الافتراضية documents/ إن لم يوجد)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="عدد العمليات المتوازية")
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_MODES,
+        default=settings.embedding_quantization,
+        help="صيغة الفهرس المضغوط بجانب ChromaDB — الافتراضي: %(default)s",
+    )
+    return parser.parse_args()
+
+
 def main():
     """تشغيل عملية التجهيز الكاملة"""
+    args = parse_args()
+    documents_dir = args.documents_dir
+    if documents_dir is None:
+        tenant_dir = DOCUMENTS_DIR / args.tenant
+        if tenant_dir.is_dir():
+            documents_dir = tenant_dir
+        elif args.tenant == get_settings().chroma_collection:
+            documents_dir = DOCUMENTS_DIR
+        else:
+            # لا نملأ قاعدة كلية جديدة بمستندات القاعدة الافتراضية بسبب خطأ في الاسم
+            logger.error(
+                f"❌ مجلد مستندات قاعدة المعرفة غير موجود: {tenant_dir} "
+                f"(أنشئه أو حدّد --documents-dir)"
+            )
+            sys.exit(1)
+
     logger.info("=" * 60)
-    logger.info("🚀 بدء تجهيز قاعدة المعرفة")
+    logger.info(f"🚀 بدء تجهيز قاعدة المعرفة: {args.tenant} ({documents_dir})")
     logger.info("=" * 60)
 
-    # 1. تحميل المستندات
-    documents = load_text_files()
-    if not documents:
-        logger.error("❌ لا توجد مستندات لمعالجتها. ضع ملفات .txt في مجلد documents/")
+    # 1. استخراج وتقطيع المستندات (بالتوازي)
+    chunks = load_documents(documents_dir, workers=args.workers)
+    if not chunks:
+        logger.error(f"❌ لا توجد مستندات لمعالجتها. ضع ملفات .txt أو .pdf أو .docx في {documents_dir}")
         sys.exit(1)
 
-    # 2. تقطيع
-    chunks = chunk_documents(documents)
+    # 2. تخزين
+    vectorstore = store_in_chromadb(assign_sections(chunks), tenant=args.tenant)
+
+    # 3. فهرس التوجيه (ملخصات المستندات والأقسام)
+    build_route_index(vectorstore._collection, args.tenant)
 
-    # 3. تخزين
-    store_in_chromadb(chunks)
+    # 4. الفهرس المضغوط (اختياري)
+    store_quantized(vectorstore, tenant=args.tenant, mode=args.quantization)
 
     logger.info("=" * 60)
     logger.info("🎉 تم تجهيز قاعدة المعرفة بنجاح!")
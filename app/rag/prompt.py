@@ -0,0 +1,88 @@
+"""بناء الموجّه — بادئة ثابتة بايتاً ببايت للاستفادة من التخزين المؤقت لدى المزوّد"""
+
+from langchain.schema import Document
+from app.config import get_settings
+
+settings = get_settings()
+
+# نماذج تحتاج علامات cache_control صريحة عبر OpenRouter (غيرها يخزّن البادئة تلقائياً)
+_CACHE_CONTROL_PREFIXES = ("anthropic/", "google/gemini")
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+SYSTEM_PROMPT = """أنت مساعد ذكي متخصص في الإجابة عن تساؤلات الدراسات العليا.
+
+## القواعد:
+1. أجب **فقط** بناءً على المعلومات الموجودة في السياق المُقدم أدناه.
+2. إذا لم تجد الإجابة في السياق، قل ذلك بوضوح ولا تختلق معلومات.
+3. أجب بالعربية بأسلوب واضح ومباشر.
+4. إذا كان السؤال يحتاج تفاصيل غير موجودة في السياق، اذكر ما تعرفه واقترح التواصل مع المختص.
+
+## التقييم:
+في نهاية إجابتك، أضف سطراً جديداً بالتنسيق التالي فقط:
+CONFIDENCE: high أو medium أو low
+
+- high: الإجابة كاملة وواضحة من السياق
+- medium: الإجابة جزئية أو تحتاج تأكيد
+- low: لم تجد معلومات كافية"""
+
+
+def _position(doc: Document) -> tuple[str, int, int]:
+    """موضع المقطع في مصدره: (الملف، الصفحة، ترتيب المقطع)"""
+    meta = doc.metadata
+    return meta.get("source", ""), meta.get("page", 0), meta.get("chunk", 0)
+
+
+def build_context(docs: list[Document]) -> str:
+    """السياق بترتيب قانوني (المستند ثم الموضع) لا بترتيب درجات التشابه
+
+    لا تدخل الدرجات في النص، فالمقاطع نفسها تُنتج دائماً البايتات نفسها
+    مهما اختلف السؤال أو ترتيب النتائج.
+    """
+    parts = []
+    for i, doc in enumerate(sorted(docs, key=_position), start=1):
+        src, page, _ = _position(doc)
+        header = f"[مقطع {i} | المصدر: {src or 'غير محدد'}" + (f" | ص {page}]" if page else "]")
+        parts.append(f"{header}\n{doc.page_content}")
+    return "\n\n---\n\n".join(parts)
+
+
+def supports_cache_control(model: str | None = None) -> bool:
+    mode = settings.prompt_cache_control
+    if mode in ("on", "off"):
+        return mode == "on"
+    return (model or settings.openrouter_model).startswith(_CACHE_CONTROL_PREFIXES)
+
+
+def build_messages(question: str, context: str, cache_control: bool | None = None) -> list[dict]:
+    """موجّه النظام الثابت ← السياق ← السؤال (الجزء المتغير دائماً في النهاية)"""
+    context_text = f"## السياق من قاعدة المعرفة:\n{context}\n\n"
+    question_text = f"## سؤال المستخدم:\n{question}\n\nأجب على السؤال بناءً على السياق أعلاه فقط."
+
+    if cache_control is None:
+        cache_control = supports_cache_control()
+    if not cache_control:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": context_text + question_text},
+        ]
+
+    return [
+        {"role": "system", "content": [
+            {"type": "text", "text": SYSTEM_PROMPT, "cache_control": _CACHE_CONTROL},
+        ]},
+        {"role": "user", "content": [
+            {"type": "text", "text": context_text, "cache_control": _CACHE_CONTROL},
+            {"type": "text", "text": question_text},
+        ]},
+    ]
+
+
+def parse_usage(data: dict) -> dict[str, int]:
+    """رموز الموجّه والإجابة والرموز المقروءة من التخزين المؤقت من رد OpenRouter"""
+    usage = data.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cached_tokens": details.get("cached_tokens") or usage.get("cache_read_input_tokens", 0) or 0,
+    }
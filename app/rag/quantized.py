@@ -0,0 +1,250 @@
+"""فهرس Embeddings مضغوط (int8 / binary) مع إعادة تقييم دقيقة من متجهات float32 على القرص"""
+
+import json
+import math
+import shutil
+import logging
+from pathlib import Path
+import numpy as np
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# عدد الصفوف التي تُعالج في كل دفعة أثناء البحث التقريبي (لتجنب نسخة float كاملة)
+_BLOCK_ROWS = 4096
+# عدد البتات المضاءة لكل قيمة بايت — لحساب مسافة Hamming
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# حجم الصفحة عند قراءة المتجهات من ChromaDB
+_FETCH_PAGE = 5000
+
+
+def index_dir(tenant: str) -> Path:
+    """مجلد الفهرس المضغوط لقاعدة المعرفة"""
+    return Path(settings.chroma_persist_dir) / "quantized" / tenant
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """تكميم متماثل لكل متجه: الرمز = round(v / scale)، scale = max|v| / 127"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """بت واحد لكل بُعد (إشارة القيمة) مضغوطاً في بايتات"""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def relevance_from_vectors(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """درجة التشابه بنفس مقياس Chroma (مسافة L2 تربيعية) + LangChain: 1 - d / √2"""
+    sq_dist = (
+        np.einsum("ij,ij->i", vectors, vectors)
+        - 2.0 * (vectors @ query)
+        + float(query @ query)
+    )
+    return 1.0 - sq_dist / math.sqrt(2)
+
+
+class QuantizedIndex:
+    """بحث مرشّحين على الرموز المضغوطة ثم إعادة تقييم القائمة القصيرة بدقة كاملة"""
+
+    def __init__(
+        self,
+        ids: list[str],
+        vectors: np.ndarray,
+        mode: str,
+        codes: np.ndarray,
+        scales: np.ndarray | None = None,
+    ):
+        self.ids = ids
+        self.mode = mode
+        self._vectors = vectors        # float32 — عادةً memmap من القرص
+        self._codes = codes
+        self._scales = scales
+        self._row_of = {doc_id: row for row, doc_id in enumerate(ids)}
+
+    # ── البناء والتخزين ──
+
+    @classmethod
+    def build(cls, ids: list[str], vectors: np.ndarray, mode: str) -> "QuantizedIndex":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if mode == "int8":
+            codes, scales = quantize_int8(vectors)
+            return cls(ids, vectors, mode, codes, scales)
+        if mode == "binary":
+            return cls(ids, vectors, mode, quantize_binary(vectors))
+        raise ValueError(f"نمط تكميم غير معروف: {mode}")
+
+    def save(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "vectors.npy", self._vectors)
+        np.save(path / "codes.npy", self._codes)
+        if self._scales is not None:
+            np.save(path / "scales.npy", self._scales)
+        (path / "ids.json").write_text(json.dumps(self.ids), encoding="utf-8")
+        (path / "meta.json").write_text(json.dumps({
+            "mode": self.mode,
+            "count": len(self.ids),
+            "dims": self.dims,
+            "embedding_model": settings.embedding_model,
+        }), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "QuantizedIndex":
+        """تحميل الرموز في الذاكرة وربط متجهات float32 بالقرص (memory-mapped)"""
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        scales_path = path / "scales.npy"
+        return cls(
+            ids=json.loads((path / "ids.json").read_text(encoding="utf-8")),
+            vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+            mode=meta["mode"],
+            codes=np.load(path / "codes.npy"),
+            scales=np.load(scales_path) if scales_path.exists() else None,
+        )
+
+    @property
+    def dims(self) -> int:
+        return int(self._vectors.shape[1])
+
+    @property
+    def resident_bytes(self) -> int:
+        """الذاكرة المقيمة: الرموز ومعاملات المقياس فقط (متجهات float32 على القرص)"""
+        size = self._codes.nbytes
+        if self._scales is not None:
+            size += self._scales.nbytes
+        return size
+
+    # ── البحث ──
+
+    def rows_for(self, ids: list[str]) -> np.ndarray:
+        """أرقام الصفوف المقابلة لمعرّفات المقاطع (لحصر البحث في أقسام محددة)"""
+        return np.array([self._row_of[i] for i in ids if i in self._row_of], dtype=np.int64)
+
+    def approximate_scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """درجات تقريبية (الأعلى أفضل) على الرموز المضغوطة، اختيارياً لصفوف محددة"""
+        codes = self._codes if rows is None else self._codes[rows]
+        scales = self._scales if rows is None or self._scales is None else self._scales[rows]
+        out = np.empty(len(codes), dtype=np.float32)
+
+        if self.mode == "binary":
+            q_bits = quantize_binary(query[None, :])[0]
+            for start in range(0, len(codes), _BLOCK_ROWS):
+                block = codes[start:start + _BLOCK_ROWS]
+                out[start:start + len(block)] = -_POPCOUNT[block ^ q_bits].sum(axis=1, dtype=np.int32)
+        else:
+            for start in range(0, len(codes), _BLOCK_ROWS):
+                block = codes[start:start + _BLOCK_ROWS]
+                out[start:start + len(block)] = (block @ query) * scales[start:start + len(block)]
+        return out
+
+    def search(
+        self,
+        query: list[float] | np.ndarray,
+        k: int,
+        rescore_multiplier: int | None = None,
+        rows: np.ndarray | None = None,
+    ) -> list[tuple[str, float]]:
+        """أفضل k نتائج: مرشّحون من الرموز ثم إعادة تقييم دقيقة من float32"""
+        query = np.asarray(query, dtype=np.float32)
+        rows = np.arange(len(self.ids)) if rows is None else np.asarray(rows)
+        if not len(rows):
+            return []
+
+        multiplier = rescore_multiplier or settings.rescore_multiplier
+        shortlist_size = min(len(rows), k * multiplier)
+
+        approx = self.approximate_scores(query, rows)
+        shortlist = np.argpartition(-approx, shortlist_size - 1)[:shortlist_size]
+        # قراءة الصفوف بالترتيب من الملف المربوط بالذاكرة
+        candidates = np.sort(rows[shortlist])
+
+        exact = relevance_from_vectors(query, np.asarray(self._vectors[candidates]))
+        top = np.argsort(-exact)[:k]
+        return [(self.ids[candidates[i]], float(exact[i])) for i in top]
+
+
+def fetch_collection_vectors(collection) -> tuple[list[str], np.ndarray, list[dict]]:
+    """قراءة جميع المعرّفات والمتجهات والبيانات الوصفية من مجموعة ChromaDB على دفعات"""
+    ids: list[str] = []
+    metadatas: list[dict] = []
+    blocks: list[np.ndarray] = []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=_FETCH_PAGE, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        metadatas.extend(meta or {} for meta in page["metadatas"])
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    vectors = np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+    return ids, vectors, metadatas
+
+
+def remove_quantized_index(tenant: str):
+    """حذف الفهرس المضغوط القديم (عند إعادة التجهيز بنمط آخر أو بدون تكميم)"""
+    path = index_dir(tenant)
+    if path.exists():
+        shutil.rmtree(path)
+        logger.info(f"🗑️ حذف الفهرس المضغوط القديم لـ {tenant}")
+
+
+def build_quantized_index(collection, tenant: str, mode: str) -> QuantizedIndex | None:
+    """بناء الفهرس المضغوط من مجموعة ChromaDB وحفظه بجانبها (بدلاً من أي فهرس سابق)"""
+    remove_quantized_index(tenant)
+    if mode == "none":
+        return None
+
+    ids, vectors, _ = fetch_collection_vectors(collection)
+    if not ids:
+        logger.warning(f"⚠️ المجموعة {tenant} فارغة — لم يُبنَ فهرس مضغوط")
+        return None
+
+    index = QuantizedIndex.build(ids, vectors, mode)
+    index.save(index_dir(tenant))
+    logger.info(
+        f"🗜️ فهرس {mode} لـ {tenant}: {len(ids)} متجه، "
+        f"{index.resident_bytes / 1024 / 1024:.1f} MB في الذاكرة بدلاً من "
+        f"{vectors.nbytes / 1024 / 1024:.1f} MB"
+    )
+    return index
+
+
+def load_quantized_index(tenant: str, expected_count: int | None = None) -> QuantizedIndex | None:
+    """تحميل الفهرس المضغوط إن كان مفعّلاً وموجوداً ومطابقاً للمجموعة
+
+    يُرفض الفهرس (ويُستخدم بحث Chroma العادي) إن اختلف نمطه أو نموذج الـ Embedding
+    عن الإعدادات، أو اختلف عدد متجهاته عن عدد مقاطع المجموعة (فهرس قديم).
+    """
+    if settings.embedding_quantization == "none":
+        return None
+    path = index_dir(tenant)
+    if not (path / "meta.json").exists():
+        return None
+    try:
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.error(f"خطأ في قراءة الفهرس المضغوط لـ {tenant}: {e}")
+        return None
+
+    if meta.get("mode") != settings.embedding_quantization:
+        reason = f"مبني بنمط {meta.get('mode')} بينما الإعداد {settings.embedding_quantization}"
+    elif meta.get("embedding_model") != settings.embedding_model:
+        reason = f"مبني بنموذج {meta.get('embedding_model')} بينما الإعداد {settings.embedding_model}"
+    elif expected_count is not None and meta.get("count") != expected_count:
+        reason = f"فيه {meta.get('count')} متجه بينما المجموعة فيها {expected_count} (أعد التجهيز)"
+    else:
+        reason = ""
+    if reason:
+        logger.warning(f"⚠️ تجاهل الفهرس المضغوط لـ {tenant}: {reason}")
+        return None
+
+    try:
+        return QuantizedIndex.load(path)
+    except Exception as e:
+        logger.error(f"خطأ في تحميل الفهرس المضغوط لـ {tenant}: {e}")
+        return None
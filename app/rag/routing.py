@@ -0,0 +1,160 @@
+"""فهرس توجيه هرمي — اختيار المستندات والأقسام الأقرب قبل البحث في المقاطع"""
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from app.config import get_settings
+from app.rag.quantized import fetch_collection_vectors, relevance_from_vectors
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class Route:
+    """قسم مُختار للبحث فيه"""
+    section: str
+    source: str
+    title: str
+    score: float
+    ids: list[str]
+
+    @property
+    def label(self) -> str:
+        return f"{self.source} › {self.title} ({self.score:.2f})"
+
+
+def routes_dir(tenant: str) -> Path:
+    """مجلد فهرس التوجيه لقاعدة المعرفة"""
+    return Path(settings.chroma_persist_dir) / "routes" / tenant
+
+
+def _centroid(vectors: np.ndarray) -> np.ndarray:
+    """متوسط المتجهات بعد التطبيع — ملخص دلالي رخيص للقسم أو المستند"""
+    mean = vectors.mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm else mean
+
+
+class RouteIndex:
+    """ملخصات على مستويين: مستند ← أقسام، تُقارن بالسؤال قبل البحث في المقاطع"""
+
+    def __init__(self, documents: list[dict], sections: list[dict],
+                 doc_vectors: np.ndarray, section_vectors: np.ndarray):
+        self.documents = documents          # {"source", "sections": [فهارس الأقسام]}
+        self.sections = sections            # {"id", "source", "title", "pages", "ids"}
+        self._doc_vectors = doc_vectors
+        self._section_vectors = section_vectors
+
+    @classmethod
+    def build(cls, ids: list[str], vectors: np.ndarray, metadatas: list[dict]) -> "RouteIndex":
+        """تجميع المقاطع حسب القسم (ثم المستند) وحساب متجه ملخص لكل منهما"""
+        section_rows: dict[str, list[int]] = {}
+        for row, meta in enumerate(metadatas):
+            section_rows.setdefault(meta.get("section") or meta.get("source", ""), []).append(row)
+
+        documents: dict[str, dict] = {}
+        sections: list[dict] = []
+        section_vectors = []
+        for section_id, rows in section_rows.items():
+            meta = metadatas[rows[0]]
+            source = meta.get("source", "غير محدد")
+            # الصفحات الحقيقية فقط (لا رقم صفحة لملفات بلا فواصل صفحات)
+            pages = [metadatas[r]["page"] for r in rows if metadatas[r].get("page")]
+            documents.setdefault(source, {"source": source, "sections": [], "rows": []})
+            documents[source]["sections"].append(len(sections))
+            documents[source]["rows"].extend(rows)
+            span = [min(pages), max(pages)] if pages else []
+            sections.append({
+                "id": section_id,
+                "source": source,
+                "title": meta.get("section_title") or (
+                    f"ص {span[0]}–{span[1]}" if span else f"قسم {len(documents[source]['sections'])}"
+                ),
+                "pages": span,
+                "ids": [ids[r] for r in rows],
+            })
+            section_vectors.append(_centroid(vectors[rows]))
+
+        doc_list = list(documents.values())
+        doc_vectors = np.vstack([_centroid(vectors[d.pop("rows")]) for d in doc_list])
+        return cls(doc_list, sections, doc_vectors, np.vstack(section_vectors).astype(np.float32))
+
+    def save(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "documents.npy", self._doc_vectors.astype(np.float32))
+        np.save(path / "sections.npy", self._section_vectors)
+        (path / "routes.json").write_text(
+            json.dumps({"documents": self.documents, "sections": self.sections}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "RouteIndex":
+        data = json.loads((path / "routes.json").read_text(encoding="utf-8"))
+        return cls(
+            data["documents"],
+            data["sections"],
+            np.load(path / "documents.npy"),
+            np.load(path / "sections.npy"),
+        )
+
+    def route(
+        self,
+        query: list[float] | np.ndarray,
+        top_documents: int | None = None,
+        top_sections: int | None = None,
+    ) -> list[Route]:
+        """أفضل الأقسام داخل أفضل المستندات — كلفتها بعدد الملخصات لا بعدد المقاطع"""
+        query = np.asarray(query, dtype=np.float32)
+        top_documents = top_documents or settings.route_top_documents
+        top_sections = top_sections or settings.route_top_sections
+
+        doc_scores = relevance_from_vectors(query, self._doc_vectors)
+        best_docs = np.argsort(-doc_scores)[:top_documents]
+
+        candidates = [s for d in best_docs for s in self.documents[d]["sections"]]
+        section_scores = relevance_from_vectors(query, self._section_vectors[candidates])
+        order = np.argsort(-section_scores)[:top_sections]
+
+        routes = []
+        for i in order:
+            section = self.sections[candidates[i]]
+            routes.append(Route(
+                section=section["id"],
+                source=section["source"],
+                title=section["title"],
+                score=float(section_scores[i]),
+                ids=section["ids"],
+            ))
+        return routes
+
+
+def build_route_index(collection, tenant: str) -> RouteIndex | None:
+    """بناء فهرس التوجيه من متجهات المقاطع المخزنة وحفظه بجانب ChromaDB"""
+    ids, vectors, metadatas = fetch_collection_vectors(collection)
+    if not ids:
+        return None
+
+    index = RouteIndex.build(ids, vectors, metadatas)
+    index.save(routes_dir(tenant))
+    logger.info(
+        f"🧭 فهرس التوجيه لـ {tenant}: {len(index.documents)} مستند، {len(index.sections)} قسم"
+    )
+    return index
+
+
+def load_route_index(tenant: str) -> RouteIndex | None:
+    """تحميل فهرس التوجيه إن كان مفعّلاً وموجوداً"""
+    if not settings.route_top_sections:
+        return None
+    path = routes_dir(tenant)
+    if not (path / "routes.json").exists():
+        return None
+    try:
+        return RouteIndex.load(path)
+    except Exception as e:
+        logger.error(f"خطأ في تحميل فهرس التوجيه لـ {tenant}: {e}")
+        return None
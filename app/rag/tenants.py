@@ -0,0 +1,211 @@
+"""سجل قواعد المعرفة — عدة كليات (مستأجرين) داخل عملية واحدة"""
+
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.vectorstores import Chroma
+from app.config import get_settings
+from app.rag.quantized import QuantizedIndex, load_quantized_index
+from app.rag.routing import RouteIndex, load_route_index
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# تقدير تقريبي لذاكرة المقطع الواحد إلى جانب متجهه: روابط HNSW + النص والبيانات الوصفية
+_HNSW_LINK_BYTES = 16 * 2 * 4
+_TEXT_BYTES_PER_CHAR = 2
+
+
+@dataclass
+class TenantMetrics:
+    """مقاييس قاعدة معرفة واحدة"""
+    queries: int = 0
+    escalations: int = 0
+    total_latency: float = 0.0
+    loads: int = 0
+    evictions: int = 0
+    last_used: float = 0.0
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.queries if self.queries else 0.0
+
+
+class KnowledgeBaseRegistry:
+    """ربط المحادثة/البوت/الأمر بقاعدة معرفة، مع تحميل كسول وإخلاء LRU
+
+    كل مستأجر مجموعة (collection) مستقلة في ChromaDB نفسها، وتتشارك جميعها
+    عميل Chroma ونموذج الـ Embedding. لا يُنشئ السجل مجموعات أبداً — تُنشأ فقط
+    عبر عملية التجهيز. تُحمَّل المجموعة عند أول سؤال، وإذا تجاوز مجموع الذاكرة
+    المقدّرة الميزانية تُخلى الأقدم استخداماً.
+
+    الإخلاء هنا يحرّر ما يملكه السجل فقط (الفهرس المضغوط وفهرس التوجيه ومرجع
+    المجموعة). أما فهارس HNSW فيحرّرها Chroma نفسه بسياسة LRU وبالميزانية نفسها،
+    وفي توقيته هو، لذا فإن أعداد الإخلاء والذاكرة في المقاييس تقديرات السجل لا
+    قياس فعلي لذاكرة Chroma.
+    """
+
+    def __init__(self, embeddings: OpenAIEmbeddings):
+        self._embeddings = embeddings
+        self._budget = settings.tenant_memory_budget_mb * 1024 * 1024
+        self._client = chromadb.PersistentClient(
+            path=settings.chroma_persist_dir,
+            settings=ChromaSettings(
+                anonymized_telemetry=False,
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=self._budget,
+            ),
+        )
+        self._loaded: OrderedDict[str, Chroma] = OrderedDict()
+        self._quantized: dict[str, QuantizedIndex] = {}
+        self._routes: dict[str, RouteIndex] = {}
+        self._sizes: dict[str, int] = {}
+        self.metrics: dict[str, TenantMetrics] = {}
+
+    @property
+    def default_tenant(self) -> str:
+        return settings.chroma_collection
+
+    def list_tenants(self) -> list[str]:
+        """أسماء قواعد المعرفة المُجهّزة (المجموعات الموجودة في ChromaDB)"""
+        try:
+            return sorted(self._client.list_collections())
+        except Exception as e:
+            logger.error(f"خطأ في قراءة قواعد المعرفة: {e}")
+            return []
+
+    def resolve(
+        self,
+        chat_id: int | None = None,
+        selected: str | None = None,
+    ) -> str:
+        """تحديد قاعدة المعرفة: اختيار بالأمر ← ربط المحادثة ← الافتراضية"""
+        for tenant in (
+            selected,
+            settings.tenant_chats.get(chat_id) if chat_id is not None else None,
+        ):
+            if tenant:
+                if tenant in self._loaded or tenant in self.list_tenants():
+                    return tenant
+                # قاعدة محذوفة أو خطأ في الاسم: ننتقل إلى القاعدة التالية في الترتيب
+                logger.warning(f"⚠️ قاعدة معرفة غير موجودة: {tenant} — تجاهلها")
+        return self.default_tenant
+
+    def get(self, tenant: str) -> Chroma:
+        """إرجاع مخزن المتجهات للمستأجر، مع تحميله عند أول استخدام
+
+        يرفع KeyError إن لم تكن المجموعة مُجهّزة (لا تُنشأ مجموعة فارغة).
+        """
+        if tenant in self._loaded:
+            self._loaded.move_to_end(tenant)
+            self.metrics[tenant].last_used = time.time()
+            return self._loaded[tenant]
+
+        try:
+            self._client.get_collection(tenant)
+        except Exception:
+            raise KeyError(f"قاعدة معرفة غير موجودة: {tenant}") from None
+
+        metrics = self.metrics.setdefault(tenant, TenantMetrics())
+        metrics.last_used = time.time()
+        start = time.perf_counter()
+        vectorstore = Chroma(
+            client=self._client,
+            collection_name=tenant,
+            embedding_function=self._embeddings,
+        )
+        count = vectorstore._collection.count()
+        quantized = load_quantized_index(tenant, expected_count=count)
+        self._loaded[tenant] = vectorstore
+        if quantized is not None:
+            self._quantized[tenant] = quantized
+        routes = load_route_index(tenant)
+        if routes is not None:
+            self._routes[tenant] = routes
+        self._sizes[tenant] = self._estimate_bytes(vectorstore, count, quantized)
+        metrics.loads += 1
+        logger.info(
+            f"📂 تحميل قاعدة المعرفة {tenant} "
+            f"(~{self._sizes[tenant] / 1024 / 1024:.1f} MB) في {time.perf_counter() - start:.2f} ث"
+        )
+
+        self._evict()
+        return vectorstore
+
+    def _evict(self):
+        """إخلاء الأقدم استخداماً حتى العودة ضمن الميزانية (مع إبقاء الأحدث دائماً)"""
+        while len(self._loaded) > 1 and self.memory_used() > self._budget:
+            tenant, _ = self._loaded.popitem(last=False)
+            self._quantized.pop(tenant, None)
+            self._routes.pop(tenant, None)
+            freed = self._sizes.pop(tenant, 0)
+            self.metrics[tenant].evictions += 1
+            logger.info(
+                f"♻️ إخلاء قاعدة المعرفة {tenant} من السجل (~{freed / 1024 / 1024:.1f} MB تقديرياً، "
+                f"ويحرّر Chroma فهرس HNSW وفق سياسته)"
+            )
+
+    def get_quantized(self, tenant: str) -> QuantizedIndex | None:
+        """الفهرس المضغوط للمستأجر (بعد get) — None إن لم يكن مفعّلاً أو مبنياً"""
+        return self._quantized.get(tenant)
+
+    def get_routes(self, tenant: str) -> RouteIndex | None:
+        """فهرس التوجيه للمستأجر (بعد get) — None إن لم يكن مفعّلاً أو مبنياً"""
+        return self._routes.get(tenant)
+
+    def memory_used(self) -> int:
+        """مجموع الذاكرة المقدّرة للقواعد المحمّلة في السجل"""
+        return sum(self._sizes.values())
+
+    def is_loaded(self, tenant: str) -> bool:
+        return tenant in self._loaded
+
+    def estimated_bytes(self, tenant: str) -> int:
+        return self._sizes.get(tenant, 0)
+
+    @staticmethod
+    def _estimate_bytes(vectorstore: Chroma, count: int, quantized: QuantizedIndex | None = None) -> int:
+        """تقدير ذاكرة المجموعة: عدد المقاطع × (المتجه + روابط HNSW + النص)
+
+        مع الفهرس المضغوط لا يُطلب أي متجه من Chroma (طلبها يحمّل فهرس HNSW كاملاً
+        في الذاكرة)، فتُحسب الرموز المقيمة بدلاً منه.
+        """
+        if not count:
+            return 0
+        include = ["documents"] if quantized is not None else ["embeddings", "documents"]
+        sample = vectorstore._collection.get(limit=1, include=include)
+        text_chars = len(sample["documents"][0]) if sample["documents"] else settings.chunk_size
+        text_bytes = count * text_chars * _TEXT_BYTES_PER_CHAR
+        if quantized is not None:
+            return quantized.resident_bytes + text_bytes
+        dims = len(sample["embeddings"][0])
+        return count * (dims * 4 + _HNSW_LINK_BYTES) + text_bytes
+
+    def record_query(self, tenant: str, latency: float, escalated: bool):
+        metrics = self.metrics.get(tenant)
+        if metrics is None:
+            # قاعدة غير موجودة — لا تُضاف إلى المقاييس
+            return
+        metrics.queries += 1
+        metrics.total_latency += latency
+        if escalated:
+            metrics.escalations += 1
+
+    def snapshot(self) -> dict[str, dict]:
+        """مقاييس جميع المستأجرين (للحالة و /health)"""
+        return {
+            tenant: {
+                "loaded": self.is_loaded(tenant),
+                "memory_mb": round(self.estimated_bytes(tenant) / 1024 / 1024, 1),
+                "queries": m.queries,
+                "escalations": m.escalations,
+                "avg_latency": round(m.avg_latency, 3),
+                "loads": m.loads,
+                "evictions": m.evictions,
+            }
+            for tenant, m in sorted(self.metrics.items())
+        }
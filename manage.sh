@@ -23,7 +23,7 @@ case "$1" in
     ;;
   ingest)
     echo "📚 تجهيز قاعدة المعرفة..."
-    docker compose exec bot python -m app.rag.ingest
+    docker compose exec bot python -m app.rag.ingest "${@:2}"
     ;;
   status)
     echo "📊 حالة البوت..."
@@ -51,7 +51,7 @@ case "$1" in
     echo "  stop     — إيقاف البوت"
     echo "  restart  — إعادة تشغيل"
     echo "  logs     — عرض السجلات"
-    echo "  ingest   — تجهيز قاعدة المعرفة"
+    echo "  ingest   — تجهيز قاعدة المعرفة (--tenant اسم_الكلية)"
     echo "  status   — حالة البوت"
     echo "  shell    — دخول الحاوية"
     echo "  update   — تحديث من GitHub"